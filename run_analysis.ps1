@@ -28,11 +28,24 @@ $FILE_NAME_COMBINED_SUMMARY = "COMBINED_SUMMARY"
 ## To only process certain subject or survey ids, add them in the same way
 ## To process data in zip files, pass the flag "--use_zips" (no value needed)
 ## To only process REDCap or Beiwe data, specify one of the mutually exclusive flags "only_beiwe" or "only_redcap":
-#  process_survey --data_dir $DATA_DIR_SURVEY --out_dir $PROCESSED_DIR_SURVEY --key_path $SURVEY_KEY_PATH --skip_dirs "dir1" "dir2" --use_zips --subject_ids "subj1" "subj2" --survey_ids "surveyid123" "surveyid44444" --only_redcap
+## To process files in parallel, pass the number of processes to use with "--workers"
+## Files that are unchanged since the last run are skipped. To process all files again, pass the flag "--full" (no value needed)
+## To change how many files are read ahead (e.g. on a network drive), pass "--prefetch_depth" (number of files) and "--prefetch_mb" (megabytes)
+## To save compressed, typed parquet files instead of CSVs, pass "--output_format parquet" (requires pyarrow)
+## To save one dataset per survey ID (one file per subject) instead of one file per survey, pass "--output_layout dataset"
+## To load Beiwe survey files with less memory (only question and answer columns are kept), pass the flag "--compact" (no value needed)
+## To save all outputs in a single zip or tar archive, pass an "--out_dir" ending with ".zip" or ".tar". Pass the same path as "--data_dir" to aggregate_survey
+#  process_survey --data_dir $DATA_DIR_SURVEY --out_dir $PROCESSED_DIR_SURVEY --key_path $SURVEY_KEY_PATH --skip_dirs "dir1" "dir2" --use_zips --subject_ids "subj1" "subj2" --survey_ids "surveyid123" "surveyid44444" --only_redcap --workers 8 --full --prefetch_depth 32 --prefetch_mb 128 --output_format parquet --output_layout dataset --compact
 
 
 ## aggregate_survey
 #  aggregate_survey --data_dir $PROCESSED_DIR_SURVEY --out_dir $PROCESSED_DIR_SURVEY --key_path $SURVEY_KEY_PATH --out_name $FILE_NAME_SURVEY_SUMMARY
+## To build the summary tab by merging surveys on subject ID only (previous behavior) instead of aligning them by timepoint, pass the flag "--legacy_summary" (no value needed)
+#  aggregate_survey --data_dir $PROCESSED_DIR_SURVEY --out_dir $PROCESSED_DIR_SURVEY --key_path $SURVEY_KEY_PATH --out_name $FILE_NAME_SURVEY_SUMMARY --legacy_summary
+## To write the summary workbook one survey at a time as it is read (less memory than pandas), pass "--summary_export stream". To save one file per tab instead (with an index workbook), pass "--summary_export bundle" and optionally "--output_format parquet"
+#  aggregate_survey --data_dir $PROCESSED_DIR_SURVEY --out_dir $PROCESSED_DIR_SURVEY --key_path $SURVEY_KEY_PATH --out_name $FILE_NAME_SURVEY_SUMMARY --summary_export bundle --output_format parquet
+## To only update the Beiwe statistics, reading only processed files that are new or changed since the last run, pass the flag "--stats_only" (no value needed)
+#  aggregate_survey --data_dir $PROCESSED_DIR_SURVEY --out_dir $PROCESSED_DIR_SURVEY --key_path $SURVEY_KEY_PATH --out_name "SURVEY_STATS" --stats_only
 
 ### Acoustic
 #  aggregate_acoustic --data_dir $DATA_DIR_ACOUSTIC --out_dir $PROCESSED_DIR_ACOUSTIC --out_name $FILE_NAME_ACOUSTIC_SUMMARY
@@ -49,6 +62,8 @@ $FILE_NAME_COMBINED_SUMMARY = "COMBINED_SUMMARY"
 
 ## aggregate_gps
 #  aggregate_gps --data_dir $DATA_DIR_GPS --out_dir $PROCESSED_DIR_GPS --out_name $FILE_NAME_GPS_SUMMARY
+## To average over other numbers of consecutive days, or pick windows differently, pass "--windows" and "--strategies" (first, longest, quality, recent)
+#  aggregate_gps --data_dir $DATA_DIR_GPS --out_dir $PROCESSED_DIR_GPS --out_name $FILE_NAME_GPS_SUMMARY --windows 7 14 30 90 --strategies first longest quality recent
 
 ## Other
 
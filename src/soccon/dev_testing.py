@@ -1,7 +1,16 @@
 # Place to write short scripts for development purposes
 from pathlib import Path
-from soccon.survey import Survey
-from soccon.utils import load_key, call_function_with_args
+from soccon.gps import window_summary
+from soccon.survey import BeiweSurvey, split_answer_options
+from soccon.output import OutputArchive
+from soccon.utils import copy_zip_member
+from soccon import output
+import pandas as pd
+import io
+import random
+import re
+import tempfile
+import timeit
 import zipfile
 import argparse
 
@@ -27,7 +36,7 @@ def process_single_survey(file, out_dir, key_path, zip_path="", export=False):
     file = Path(file)
     out_dir = Path(out_dir)
     out_dir.mkdir(exist_ok=True)
-    key_df = load_key(key_path)
+    key_df = BeiweSurvey.load_key(key_path)
 
     # Don't error if this survey isn't in key. Print message and move on
     try:
@@ -45,26 +54,253 @@ def process_single_survey(file, out_dir, key_path, zip_path="", export=False):
 
     # Generate survey object
     this_survey = (
-        Survey(
+        BeiweSurvey(
             file=file,
             key=this_key,
             subject_id=this_subj_id,
             file_df=zf.open(str(file.relative_to(zip_path)).replace("\\","/")),
         )  # zip file requires special handling
         if zip_path
-        else Survey(file=file, key=this_key, subject_id=this_subj_id)
+        else BeiweSurvey(file=file, key=this_key, subject_id=this_subj_id)
     )
 
     # If there is no scoring to be done, just clean and save survey
     if this_key["index"] is None and this_key["invert"] is None:
-        this_survey.clean(minimal=True)
+        this_survey.clean_to_save()
     else:
         this_survey.parse_and_score()
 
     if export:
         this_survey.export(this_out_dir)
-        
-        
+
+
+# Answer option strings with known edge cases for `split_answer_options`
+SPLIT_CORPUS = [
+    "Not at all;Somewhat;Very much",
+    "Not at all; Somewhat; Very much",
+    "a;b;c;d",
+    "a; b; c; d",
+    "ab;c;de",
+    "A;B C;D",
+    "1;2;3;4;5",
+    "Normal;Slow or sloppy; but no help needed;Not all words are legible",
+    "Normal; Slow or sloppy; but no help needed; Not all words are legible",
+    "x;;y",
+    "x ;y; z",
+    "only one option",
+    "",
+]
+
+
+def split_answer_options_regex(opts):
+    """Regex implementation of answer option splitting that `split_answer_options` replaced.
+    Kept as a reference for `fuzz_split_answer_options` and `bench_split_answer_options`.
+    Returns None where the original implementation raised (no separator found).
+    """
+    sc_space_sep = False
+    ans_opts = []
+    prev_split = []  # Will be an re.Match object
+    this_split = None
+
+    if re.findall(r"\S;\S", opts):
+        splits = re.finditer(r"\S;\S", opts)
+    else:
+        splits = re.finditer(r"\S;\s\S", opts)
+        sc_space_sep = True
+
+    while True:
+        try:
+            this_split = splits.__next__()
+            if not prev_split:
+                ans_opts.append(opts[0 : this_split.start() + 1])
+            elif (not sc_space_sep and this_split.start() - prev_split.end() == 1) or (
+                sc_space_sep and this_split.start() - prev_split.end() == 2
+            ):
+                ans_opts.extend([opts[prev_split.end() - 1], opts[this_split.start()]])
+            else:
+                ans_opts.append(opts[prev_split.end() - 1 : this_split.start() + 1])
+            prev_split = this_split
+        except StopIteration:
+            if this_split is None:
+                return None
+            last_block = opts[this_split.end() - 1 : len(opts)]
+            if re.match(r"\S;\S", last_block):
+                ans_opts.extend(
+                    [opts[this_split.end() - 1], opts[this_split.end() + 1 : len(opts)]]
+                )
+            elif re.match(r"\S;\s\S", last_block):
+                ans_opts.extend(
+                    [opts[this_split.end() - 1], opts[this_split.end() + 2 : len(opts)]]
+                )
+            else:
+                ans_opts.append(last_block)
+            break
+    return ans_opts, sc_space_sep
+
+
+def fuzz_split_answer_options(n_cases=100000, seed=0):
+    """Checks `split_answer_options` against `split_answer_options_regex`
+    on `SPLIT_CORPUS` and `n_cases` random strings built from separator-heavy characters.
+
+    Args:
+        n_cases (int, optional): Number of random strings to test. Defaults to 100000.
+        seed (int, optional): Random seed. Defaults to 0.
+
+    Raises:
+        AssertionError: Outputs differ
+    """
+    rng = random.Random(seed)
+    chars = ["a", "b", "x", ";", ";", " ", " ", "\t", "\u3000"]
+    cases = SPLIT_CORPUS + [
+        "".join(rng.choice(chars) for _ in range(rng.randint(0, 16)))
+        for _ in range(n_cases)
+    ]
+
+    n_compared = 0
+    for opts in cases:
+        expected = split_answer_options_regex(opts)
+        if expected is None:  # Regex version raised, nothing to compare against
+            continue
+        result = split_answer_options(opts)
+        assert result == expected, f"{opts!r}: {result} != {expected}"
+        n_compared += 1
+    print(f"{n_compared} option strings parsed identically")
+
+
+def bench_split_answer_options(number=20000):
+    """Times `split_answer_options` against `split_answer_options_regex` on `SPLIT_CORPUS`
+
+    Args:
+        number (int, optional): Number of times each string is parsed. Defaults to 20000.
+    """
+    for opts in SPLIT_CORPUS:
+        if split_answer_options_regex(opts) is None:
+            continue
+        t_regex = timeit.timeit(lambda: split_answer_options_regex(opts), number=number)
+        t_scan = timeit.timeit(lambda: split_answer_options(opts), number=number)
+        print(
+            f"{t_regex / t_scan:5.1f}x faster ({t_scan:.3f}s vs {t_regex:.3f}s): {opts!r}"
+        )
+
+
+def check_window_strategies():
+    """Checks that the "quality" strategy of `window_summary` ranks windows by observed time
+    on daily output where every day has a row, i.e. where counting rows can't tell windows apart.
+    The first 41 days have half an hour of data each, the next 40 days have full days.
+
+    Raises:
+        AssertionError: The "quality" window isn't the one with full days
+    """
+    days = pd.date_range("2024-01-01", periods=81)
+    df = pd.DataFrame(
+        {
+            "year": days.year,
+            "month": days.month,
+            "day": days.day,
+            "obs_duration": [0.5] * 41 + [24.0] * 40,
+            "dist_traveled": 1.0,
+        }
+    )
+    summary = window_summary(df, windows=(30,), strategies=("first", "quality")).iloc[0]
+    assert summary["continuous_obs_start_study_date"] == 0, summary
+    assert summary["quality_30d_start_study_date"] == 41, summary
+    assert summary["quality_30d_obs_duration_mean"] == 24.0, summary
+    print(
+        f"first window starts on day {summary['continuous_obs_start_study_date']},",
+        f"quality window on day {summary['quality_30d_start_study_date']}",
+    )
+
+
+class _UnseekableBuffer(io.BytesIO):
+    """In-memory file that zipfile can't seek in, so it writes data descriptors after every member"""
+
+    def seekable(self):
+        return False
+
+    def seek(self, *args):
+        raise io.UnsupportedOperation("seek")
+
+    def tell(self):
+        raise io.UnsupportedOperation("tell")
+
+
+def _zip_with_members(seekable):
+    """Zip file (bytes) with a stored, a deflated and a zip64 member. Written without seeking,
+    every member is followed by a data descriptor (with 8 byte sizes for the zip64 member).
+    """
+    buffer = io.BytesIO() if seekable else _UnseekableBuffer()
+    contents = {
+        "stored.csv": b"a,b\n1,2\n" * 50,
+        "deflated.csv": b"question,answer\n" + b"Not at all;Somewhat,Somewhat\n" * 200,
+        "zip64.csv": b"x\n" * 300,
+    }
+    with zipfile.ZipFile(buffer, "w") as zf:
+        for name, data in contents.items():
+            info = zipfile.ZipInfo(name, date_time=(2024, 1, 2, 3, 4, 6))
+            info.compress_type = (
+                zipfile.ZIP_STORED if name == "stored.csv" else zipfile.ZIP_DEFLATED
+            )
+            with zf.open(info, "w", force_zip64=name == "zip64.csv") as f:
+                f.write(data)
+    return buffer.getvalue(), contents
+
+
+def _check_zip(data, contents):
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.testzip() is None, "Bad CRC after copying"
+        assert {x.filename: zf.read(x) for x in zf.infolist()} == contents
+
+
+def check_copy_zip_member():
+    """Checks that zip members copied by `copy_zip_member` (and by `OutputArchive` when it rewrites
+    an archive, with and without falling back to `ZipFile.writestr`) read back unchanged.
+    Covers members with data descriptors and zip64 members.
+
+    Raises:
+        AssertionError: A copied zip file is corrupt or its contents differ
+    """
+    for seekable in (True, False):
+        src, contents = _zip_with_members(seekable)
+        with zipfile.ZipFile(io.BytesIO(src)) as zf:
+            infos = zf.infolist()
+        descriptors = sum(bool(x.flag_bits & 0x08) for x in infos)
+        assert descriptors == (0 if seekable else len(infos)), descriptors
+
+        # Copied directly. Members (headers, contents and data descriptors) come before the
+        # central directory and must be copied byte for byte.
+        copied = io.BytesIO()
+        with zipfile.ZipFile(copied, "w") as writer:
+            for info in infos:
+                copy_zip_member(io.BytesIO(src), info, writer)
+        _check_zip(copied.getvalue(), contents)
+        with zipfile.ZipFile(io.BytesIO(src)) as zf:
+            n_bytes = zf.start_dir
+        assert copied.getvalue()[:n_bytes] == src[:n_bytes], "Members changed"
+
+        # Kept by `OutputArchive` while another member is added
+        for fallback in (False, True):
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                path = Path(tmp_dir, "outputs.zip")
+                path.write_bytes(src)
+                archive = OutputArchive(path)
+                archive.write("added.csv", b"y\n")
+                if fallback:
+                    # As if zipfile's internals had changed
+                    def fail(*args):
+                        raise AttributeError("start_dir")
+
+                    output.copy_zip_member, copy_member = fail, output.copy_zip_member
+                try:
+                    archive.close()
+                finally:
+                    if fallback:
+                        output.copy_zip_member = copy_member
+                _check_zip(path.read_bytes(), contents | {"added.csv": b"y\n"})
+        print(
+            f"{len(infos)} members ({descriptors} with data descriptors) copied intact"
+        )
+
+
 def cli_dev():
     """Sets up and runs argparser.
     Takes in command line arguments and dispatches to correct function.
@@ -85,6 +321,23 @@ def cli_dev():
     parser_process_single_survey.add_argument("--export", type=bool, default=False)
     parser_process_single_survey.set_defaults(func=process_single_survey)
 
+    # Answer option splitting
+    parser_fuzz = subparsers.add_parser("fuzz_split_answer_options")
+    parser_fuzz.add_argument("--n_cases", type=int, default=100000)
+    parser_fuzz.add_argument("--seed", type=int, default=0)
+    parser_fuzz.set_defaults(func=fuzz_split_answer_options)
+    parser_bench = subparsers.add_parser("bench_split_answer_options")
+    parser_bench.add_argument("--number", type=int, default=20000)
+    parser_bench.set_defaults(func=bench_split_answer_options)
+
+    # GPS window strategies
+    parser_windows = subparsers.add_parser("check_window_strategies")
+    parser_windows.set_defaults(func=check_window_strategies)
+
+    # Copying zip members
+    parser_zip = subparsers.add_parser("check_copy_zip_member")
+    parser_zip.set_defaults(func=check_copy_zip_member)
+
     # Collect args
     args = parser.parse_args()
 
@@ -95,7 +348,7 @@ def cli_dev():
             print(arg_name, ": ", value, sep="")
 
     # Call
-    call_function_with_args(args.func, args)
+    args.func(**{k: v for k, v in vars(args).items() if k != "func"})
 
 
 if __name__ == "__main__":
@@ -1,114 +1,285 @@
-import calendar
+import numpy as np
+import pandas as pd
 
+DATE_COLUMNS = ["year", "month", "day"]
 
-def is_consecutive(days, months, years):
-    """Determines if passed data constitute a continuous set of days.
+# How `window_summary` picks the window of each length among the runs of consecutive days:
+# the first one, the first one of the longest run, the one with the most hours observed, or the last one
+WINDOW_STRATEGIES = ("first", "longest", "quality", "recent")
+
+# Forest's hours of data behind each row, summed over a window to rank windows by data quality.
+# If missing, windows are ranked by their number of non-missing values.
+QUALITY_COLUMN = "obs_duration"
+
+# The window `aggregate_gps` summarized before windows and strategies could be chosen.
+# Its columns keep their original names (and "<column>_mean" for the means) so that existing readers still work.
+LEGACY_WINDOW = ("first", 30)
+LEGACY_WINDOW_COLUMNS = {
+    "found": "thirty_days_continuous",
+    "start_date": "continuous_obs_start_date",
+    "end_date": "continuous_obs_end_date",
+    "start_study_date": "continuous_obs_start_study_date",
+    "end_study_date": "continuous_obs_end_study_date",
+}
+
+
+class DayIndex(object):
+    """Days with data in a subject's GPS output. Built once and shared by the GPS helpers,
+    so the output isn't grouped by day again for every lookup.
+    """
+
+    def __init__(self, df, dropna=True):
+        """Groups the rows of `df` by day
+
+        Args:
+            df (DataFrame): Output CSV of `process_gps` loaded in as a pandas DataFrame.
+            dropna (bool, optional): Only count days with a row without missing values
+                as observed (rows with missing values of those days are still indexed). Defaults to True.
+        """
+        observed = df.dropna(how="any") if dropna else df
+        # One row per day (sorted) with columns "year", "month", "day" and 0 (number of rows)
+        self.days = observed.groupby(DATE_COLUMNS).size().reset_index()
+        days = pd.MultiIndex.from_frame(self.days[DATE_COLUMNS])
+
+        # Observation day of every row of `df` (-1 if its day isn't observed)
+        self.row_day = days.get_indexer(pd.MultiIndex.from_frame(df[DATE_COLUMNS]))
+        self._obs_days = {day: obs_day for obs_day, day in enumerate(days)}
+
+        # First and last row positions of every day
+        rows = pd.Series(np.arange(len(df)))[self.row_day >= 0]
+        bounds = rows.groupby(self.row_day[self.row_day >= 0]).agg(["min", "max"])
+        bounds = bounds.reindex(pd.RangeIndex(len(self.days)), fill_value=-1)
+        self.first_row = bounds["min"].to_numpy()
+        self.last_row = bounds["max"].to_numpy()
+
+        # Days since the epoch, so consecutive days differ by 1
+        self.ordinals = (
+            pd.to_datetime(self.days[DATE_COLUMNS].astype(int), errors="coerce")
+            .to_numpy()
+            .astype("datetime64[D]")
+            .astype(np.int64)
+        )
+
+    def __len__(self):
+        return len(self.days)
+
+    def obs_day(self, day):
+        """Returns the observation day of `day`
+
+        Args:
+            day (Series): "year", "month", and "day" values to find
+
+        Raises:
+            Exception: day not found
+
+        Returns:
+            int: Observation day (0-indexed)
+        """
+        obs_day = self._obs_days.get(tuple(day[DATE_COLUMNS]))
+        if obs_day is None:
+            raise Exception(
+                "Given group of ",
+                day["year"],
+                day["month"],
+                day["day"],
+                "not found in DataFrame",
+            )
+        return obs_day
+
+    def day(self, obs_day):
+        """Returns the "year", "month", and "day" values of observation day `obs_day`"""
+        return self.days.loc[obs_day, DATE_COLUMNS]
+
+    def rows(self, day):
+        """Returns the positions of the first and last rows of `day` (see `obs_day`)"""
+        obs_day = self.obs_day(day)
+        return self.first_row[obs_day], self.last_row[obs_day]
+
+
+def contiguous_runs(day_index):
+    """Finds every run of consecutive days. Runs are found where the
+    difference between neighbouring day ordinals isn't 1.
 
     Args:
-        days (Series): Day values
-        months (Series): Month values
-        years (Series): Year values
+        day_index (DayIndex): Days with data
 
     Returns:
-        bool: True if data is consecutive, otherwise False
-        int: Last "valid" index. If whole range is continuous, this is equal to length of values,
-            if discontinuity found, this is equal to the ind on which the loop broke
+        DataFrame: One row per run, in order. Columns = "start", "end" (observation days, inclusive), "length"
     """
-    for ind, (day, day_next, month, month_next, year, year_next) in enumerate(
-        zip(days, days[1:], months, months[1:], years, years[1:])
-    ):
-        if (
-            (
-                day + 1 != day_next
-            )  # This breaks continuity unless day_next is the start of a new month
-            and (
-                (day_next != 1)  # Next day is not the start of a new month
-                or (
-                    day != calendar.monthrange(year, month)[1]
-                )  # Current day isn't the end of the month
-                or (
-                    (month + 1 != month_next) and (month != 12 and month_next != 1)
-                )  # If month didn't go up by one and it wasn't a new year
-                or ((month == 12 and month_next == 1) and (year + 1 != year_next))
-            )
-            or (
-                (day + 1 == day_next) and (month != month_next)
-            )  # Day is correct but month isn't
-            or (
-                (day + 1 == day_next) and (month == month_next) and (year != year_next)
-            )  # Day and month are correct but year isn't
-        ):
-            return False, ind
-        else:
-            continue
-    return True, ind + 1
-
-
-def find_n_cont_days(df, n):
+    if not len(day_index):
+        return pd.DataFrame({"start": [], "end": [], "length": []}, dtype=np.int64)
+    breaks = np.flatnonzero(np.diff(day_index.ordinals) != 1) + 1
+    starts = np.append(0, breaks)
+    ends = np.append(breaks - 1, len(day_index) - 1)
+    return pd.DataFrame({"start": starts, "end": ends, "length": ends - starts + 1})
+
+
+def first_run(runs, n):
+    """Returns the first run of at least `n` days
+
+    Args:
+        runs (DataFrame): Runs from `contiguous_runs`
+        n (int): Minimum number of days
+
+    Returns:
+        Series: Row of `runs`. None if no run is long enough.
+    """
+    long_enough = np.flatnonzero(runs["length"].to_numpy() >= n)
+    return runs.iloc[long_enough[0]] if len(long_enough) else None
+
+
+def longest_run(runs):
+    """Returns the longest run (the first one if several are as long)
+
+    Args:
+        runs (DataFrame): Runs from `contiguous_runs`
+
+    Returns:
+        Series: Row of `runs`. None if there are no runs.
+    """
+    return runs.iloc[runs["length"].to_numpy().argmax()] if len(runs) else None
+
+
+def find_n_cont_days(df, n, day_index=None):
     """Determines if `n` consecutive days exist in `df`.
+    Only days with a row without missing values count.
 
     Args:
         df (DataFrame): Output CSV of `process_gps` loaded in as a pandas DataFrame.
         n (int, optional): Number of days to check for consecutivity. Defaults to 30.
+        day_index (DayIndex, optional): Days of `df`, if already built. Defaults to None.
 
     Returns:
-        bool: True if `n` consecutive days were found, False otherwise
-        Series: Start day (day, month, year). If no consecutive set of days found, last tested start day.
-        Series: End day (day, month, year). If no consecutive set of days found, last tested end day.
+        int: `n` if `n` consecutive days were found, otherwise the number of days of the longest run
+        Series: Start day (day, month, year). If no consecutive set of days found, start of the longest run.
+        Series: End day (day, month, year). If no consecutive set of days found, end of the longest run.
     """
-    # Drop all rows containing NaNs
-    df.dropna(how="any", inplace=True)
-    df_grouped = df.groupby(["year", "month", "day"]).size().reset_index()
-
-    start_ind = 0
-    final_ind = len(df_grouped) - 1 if n is None or n > len(df_grouped) else n - 1
-    max_cont_days = 0
-    best_cont_days = []
-
-    # Only able to loop if df is long enough wrt final_ind
-    while (
-        final_ind <= len(df_grouped) - 1
-        and max_cont_days < len(df_grouped) - 1 - start_ind
-    ):
-        # Check for continuity in this range
-        consecutive_found, break_ind = is_consecutive(
-            df_grouped.loc[start_ind:final_ind, "day"],
-            df_grouped.loc[start_ind:final_ind, "month"],
-            df_grouped.loc[start_ind:final_ind, "year"],
-        )
-        break_ind = start_ind + break_ind
-        if n is not None and consecutive_found:
-            return (
-                break_ind - start_ind + 1,
-                df_grouped.loc[start_ind, ["year", "month", "day"]],
-                df_grouped.loc[break_ind, ["year", "month", "day"]],
-            )
-        else:
-            # Update range to check starting at failure point of previous range
-            curr_cont_days = break_ind - start_ind + 1
-            if curr_cont_days > max_cont_days:
-                max_cont_days = curr_cont_days
-                best_cont_days = [
-                    df_grouped.loc[start_ind, ["year", "month", "day"]],
-                    df_grouped.loc[break_ind, ["year", "month", "day"]],
-                ]
-            start_ind = break_ind + 1
-            # if looking for the max (n is None), only update the starting index
-            final_ind = start_ind + n - 1 if n is not None else len(df_grouped) - 1
+    day_index = DayIndex(df) if day_index is None else day_index
+    runs = contiguous_runs(day_index)
+
+    run = first_run(runs, n) if n is not None else None
+    if run is not None:
+        start, end = run["start"], run["start"] + n - 1
+    else:
+        run = longest_run(runs)
+        if run is None:
+            return 0, None, None
+        start, end = run["start"], run["end"]
+    return int(end - start + 1), day_index.day(start), day_index.day(end)
+
 
-    # Can't find consecutive sequence of days either b/c df_grouped is too short or from is_consecutive
-    return max_cont_days, best_cont_days[0], best_cont_days[1]
+def window_start(runs, n, strategy, quality=None):
+    """Picks the window of `n` consecutive days to summarize
 
+    Args:
+        runs (DataFrame): Runs from `contiguous_runs`
+        n (int): Number of days of the window
+        strategy (str): One of `WINDOW_STRATEGIES`
+        quality (ndarray, optional): Cumulative amount of data (e.g. hours observed) up to each day
+            (length = days + 1). Required for the "quality" strategy. Defaults to None.
+
+    Returns:
+        int: Position of the first day of the window. None if no run is long enough.
+    """
+    starts, ends, lengths = (runs[col].to_numpy() for col in ["start", "end", "length"])
+    long_enough = np.flatnonzero(lengths >= n)
+    if not len(long_enough):
+        return None
+    if strategy == "first":
+        return int(starts[long_enough[0]])
+    if strategy == "recent":
+        return int(ends[long_enough[-1]] - n + 1)
+    if strategy == "longest":
+        return int(starts[lengths.argmax()])
+    # Every window that fits in a run, then the one with the most data (the first if tied)
+    run_end = np.repeat(ends, lengths)
+    candidates = np.flatnonzero(run_end >= np.arange(len(run_end)) + n - 1)
+    return int(candidates[(quality[candidates + n] - quality[candidates]).argmax()])
 
-def find_max_cont_days(df):
-    return find_n_cont_days(df, None)
+
+def window_summary(df, windows=(30,), strategies=("first",), day_index=None):
+    """Summarizes `df` over windows of consecutive days. For every window length and strategy,
+    the window is picked (see `window_start`) and the mean of every data column over it is taken.
+    Sums and counts per day are accumulated once, so each window costs O(1) per column.
+    As in `find_n_cont_days`, only days with a row without missing values count as observed.
+    The "quality" strategy picks the window with the most hours of data (`QUALITY_COLUMN`).
+
+    Args:
+        df (DataFrame): Output CSV of `process_gps` loaded in as a pandas DataFrame.
+        windows (list, optional): Numbers of days of the windows. Defaults to (30,).
+        strategies (list, optional): Items of `WINDOW_STRATEGIES`. Defaults to ("first",).
+        day_index (DayIndex, optional): Days of `df`, if already built. Defaults to None.
+
+    Returns:
+        DataFrame: One row. For each window and strategy, columns prefixed by "<strategy>_<n>d_":
+            "found", "start_date", "end_date", "start_study_date", "end_study_date"
+            (study dates are 0-indexed observation days) and "<column>_mean" for every data column.
+            Columns of `LEGACY_WINDOW` aren't prefixed: means come first, then `LEGACY_WINDOW_COLUMNS`.
+    """
+    day_index = DayIndex(df) if day_index is None else day_index
+    runs = contiguous_runs(day_index)
+
+    # Sums and counts of the data on every observed day, accumulated over days
+    day_pos = day_index.row_day
+    values = df.drop(columns=DATE_COLUMNS + ["hour"], errors="ignore").select_dtypes(
+        "number"
+    )
+    grouped = values[day_pos >= 0].groupby(day_pos[day_pos >= 0])
+    day_range = pd.RangeIndex(len(day_index))
+    cum_sums = np.zeros((len(day_index) + 1, values.shape[1]))
+    cum_counts = np.zeros((len(day_index) + 1, values.shape[1]))
+    cum_sums[1:] = grouped.sum().reindex(day_range, fill_value=0).cumsum()
+    cum_counts[1:] = grouped.count().reindex(day_range, fill_value=0).cumsum()
+    if QUALITY_COLUMN in values.columns:
+        quality = cum_sums[:, values.columns.get_loc(QUALITY_COLUMN)]
+    else:
+        quality = cum_counts.sum(axis=1)
+
+    summary = {}
+    for n in windows:
+        for strategy in strategies:
+            start = window_start(runs, n, strategy, quality)
+            found = start is not None
+            end = start + n - 1 if found else None
+            window = {"found": found}
+            for name, pos in (("start", start), ("end", end)):
+                window[name + "_date"] = (
+                    date_series_to_str(day_index.day(pos)) if found else None
+                )
+                window[name + "_study_date"] = pos
+            if found:
+                counts = cum_counts[end + 1] - cum_counts[start]
+                sums = cum_sums[end + 1] - cum_sums[start]
+                means = np.divide(
+                    sums, counts, out=np.full(len(sums), np.nan), where=counts > 0
+                )
+            else:
+                means = np.full(values.shape[1], np.nan)
+            means = dict(zip(values.columns + "_mean", means))
+
+            if (strategy, n) == LEGACY_WINDOW:
+                summary.update(means)
+                summary.update(
+                    (LEGACY_WINDOW_COLUMNS[name], window[name])
+                    for name in LEGACY_WINDOW_COLUMNS
+                )
+            else:
+                prefix = f"{strategy}_{n}d_"
+                summary.update((prefix + name, value) for name, value in window.items())
+                summary.update((prefix + name, value) for name, value in means.items())
+    return pd.DataFrame([summary])
+
+
+def find_max_cont_days(df, day_index=None):
+    return find_n_cont_days(df, None, day_index)
 
 
 def day_to_obs_day(df, day):
     """Returns the observation day of a given Series that has values of "year", "month", and "day"
 
     Args:
-        df (DataFrame): csv output of gps_stats_main read in by Pandas
+        df (Union[DataFrame, DayIndex]): csv output of gps_stats_main read in by Pandas
+            (every day with a row counts), or its `DayIndex`. Pass the `DayIndex` for repeated lookups.
         day (Series): "year", "month", and "day" values to find
 
     Raises:
@@ -117,19 +288,8 @@ def day_to_obs_day(df, day):
     Returns:
         int: Observation day (0-indexed)
     """
-    df_grouped = df.groupby(["year", "month", "day"]).size().reset_index()
-    idx = df_grouped.index[(df_grouped[["year", "month", "day"]] == day).all(axis=1)]
-
-    if idx.empty:
-        raise Exception(
-            "Given group of ",
-            day["year"],
-            day["month"],
-            day["day"],
-            "not found in DataFrame",
-        )
-    else:
-        return idx[0]
+    day_index = df if isinstance(df, DayIndex) else DayIndex(df, dropna=False)
+    return day_index.obs_day(day)
 
 
 def date_series_to_str(date):
@@ -1,8 +1,14 @@
+import io
+import os
 import argparse
 import zipfile
 
 from pathlib import Path
 from datetime import datetime
+from functools import partial
+from itertools import chain
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
 
 import pandas as pd
 
@@ -13,10 +19,495 @@ from soccon.survey import (
     RedcapSurvey,
     aggregate_beiwe,
     aggregate_redcap,
+    beiwe_sheets,
+    beiwe_survey_names,
+    redcap_sheets,
 )
-from soccon.utils import disp_run_info, excel_style
+from soccon.output import (
+    OUTPUT_FORMATS,
+    OUTPUT_LAYOUTS,
+    SUMMARY_EXPORTS,
+    require_parquet,
+    is_archive,
+    open_output,
+    partition_path,
+    upsert_partition,
+    write_bundle,
+    write_workbook,
+)
+from soccon.utils import (
+    disp_run_info,
+    excel_style,
+    fingerprint,
+    prefetch,
+    read_zip_member,
+    PREFETCH_DEPTH,
+    PREFETCH_MB,
+)
+from soccon import manifest
 from soccon.acoustic import process_spa
-from soccon.gps import find_n_cont_days, day_to_obs_day, date_series_to_str
+from soccon.gps import WINDOW_STRATEGIES, window_summary
+
+# Survey keys loaded once per process by `_init_survey_worker`
+_worker_keys = {}
+
+# Maximum number of instances of a Beiwe survey scored together by `process_survey`
+SCORE_BATCH_SIZE = 64
+
+
+def process_beiwe(
+    file,
+    out_dir,
+    key_df,
+    plans,
+    subject_ids=None,
+    survey_ids=None,
+    file_df="",
+    output_format="csv",
+    output_layout="files",
+    save=True,
+    compact=False,
+):
+    """Cleans and scores a single Beiwe survey CSV and saves it in `out_dir` by survey ID
+
+    Args:
+        file (Path): Path to the survey CSV (or its name within a zip file)
+        out_dir (Path): Path to directory in which data will be saved
+        key_df (DataFrame): Key loaded by `BeiweSurvey.load_key`
+        plans (dict): Scoring plans compiled from `key_df`
+        subject_ids (list, optional): List of subject IDs to process. Defaults to None.
+        survey_ids (list, optional): List of survey IDs to process. Defaults to None.
+        file_df (str, optional): Readable CSV if `file` is in a zip file. Defaults to "".
+        output_format (str, optional): One of `OUTPUT_FORMATS`. Defaults to "csv".
+        output_layout (str, optional): One of `OUTPUT_LAYOUTS`. If "dataset", nothing is saved
+            and the rows for the survey's dataset are returned instead. Defaults to "files".
+        save (bool, optional): If False, the file isn't saved and its path is returned
+            with its contents. Defaults to True.
+        compact (bool, optional): Load the CSV with less memory (see `read_survey_csv`). Defaults to False.
+
+    Returns:
+        tuple: (list of messages for the user, path of the saved file
+            (or tuple of path and contents if not `save`, or DataFrame of dataset rows)
+            or None if skipped)
+    """
+    return process_beiwe_many(
+        [file],
+        out_dir,
+        key_df,
+        plans,
+        subject_ids=subject_ids,
+        survey_ids=survey_ids,
+        file_dfs=[file_df],
+        output_format=output_format,
+        output_layout=output_layout,
+        save=save,
+        compact=compact,
+    )[0]
+
+
+def process_beiwe_many(
+    files,
+    out_dir,
+    key_df,
+    plans,
+    subject_ids=None,
+    survey_ids=None,
+    file_dfs=None,
+    output_format="csv",
+    output_layout="files",
+    save=True,
+    compact=False,
+):
+    """Cleans and scores several Beiwe survey CSVs and saves them in `out_dir` by survey ID.
+    Instances of the same survey are scored together (see `BeiweSurvey.parse_and_score_many`).
+
+    Args:
+        files (list): Paths to the survey CSVs (or their names within a zip file)
+        out_dir (Path): Path to directory in which data will be saved
+        key_df (DataFrame): Key loaded by `BeiweSurvey.load_key`
+        plans (dict): Scoring plans compiled from `key_df`
+        subject_ids (list, optional): List of subject IDs to process. Defaults to None.
+        survey_ids (list, optional): List of survey IDs to process. Defaults to None.
+        file_dfs (list, optional): Readable CSV of each file (see `process_beiwe`). Defaults to None.
+        output_format (str, optional): One of `OUTPUT_FORMATS`. Defaults to "csv".
+        output_layout (str, optional): One of `OUTPUT_LAYOUTS`. Defaults to "files".
+        save (bool, optional): Save the output files (see `process_beiwe`). Defaults to True.
+        compact (bool, optional): Load the CSVs with less memory (see `read_survey_csv`). Defaults to False.
+
+    Returns:
+        list: Result of `process_beiwe` for each file, in order
+    """
+    file_dfs = [""] * len(files) if file_dfs is None else file_dfs
+    results = [([], None)] * len(files)
+
+    # Survey ID -> [(position in `files`, survey)]
+    to_score = {}
+    surveys = []
+    for i, (file, file_df) in enumerate(zip(files, file_dfs)):
+        # Don't error if this survey isn't in key. Return message and move on
+        try:
+            this_key = key_df[file.parent.name]
+        except KeyError:
+            results[i] = (
+                [f"Survey ID '{file.parent.name}' not found in key. Skipping..."],
+                None,
+            )
+            continue
+
+        # Standard file structure for Beiwe downloads
+        this_subj_id = file.parent.parent.parent.name
+
+        if (subject_ids is not None and this_subj_id not in subject_ids) or (
+            survey_ids is not None and file.parent.name not in survey_ids
+        ):
+            continue
+
+        # Generate survey object
+        this_survey = BeiweSurvey(
+            file=file,
+            key=this_key,
+            subject_id=this_subj_id,
+            file_df=file_df,
+            plan=plans[file.parent.name],
+            compact=compact,
+        )
+        surveys.append((i, this_survey))
+
+        # If there is no scoring to be done, just clean and save survey
+        if this_key["index"] is None and this_key["invert"] is None:
+            this_survey.clean_to_save()
+        else:
+            to_score.setdefault(this_survey.id, []).append(this_survey)
+
+    for same_id in to_score.values():
+        BeiweSurvey.parse_and_score_many(same_id)
+
+    for i, this_survey in surveys:
+        # Datasets are shared by many files, so they are updated by the caller
+        if output_layout == "dataset":
+            results[i] = ([], this_survey.dataset_rows())
+            continue
+
+        # Make out dir in specified path + survey id
+        this_out_dir = out_dir.joinpath(this_survey.id)
+        if not save:
+            name, data = this_survey.export_data(output_format=output_format)
+            results[i] = ([], (this_out_dir.joinpath(name), data))
+        else:
+            this_out_dir.mkdir(exist_ok=True, parents=True)
+            results[i] = (
+                [],
+                this_survey.export(this_out_dir, output_format=output_format),
+            )
+    return results
+
+
+def _redcap_key(file, key_df):
+    """Returns the rows of the REDCap key that belong to the form in `file`
+
+    Args:
+        file (Path): Path to the survey CSV (or its name within a zip file)
+        key_df (DataFrame): Key loaded by `RedcapSurvey.load_key`
+
+    Returns:
+        DataFrame: Rows of `key_df` for this form. None if no form matches `file`.
+    """
+    this_name = next(
+        (form for form in key_df["Form Name"].unique() if form in file.stem), None
+    )
+    if this_name is None:
+        return None
+    return key_df[key_df["Form Name"].str.contains(this_name)]
+
+
+def process_redcap(
+    file, out_dir, key_df, file_df="", output_format="csv", save=True, choices=None
+):
+    """Processes a single REDCap export CSV and saves it in `out_dir` by form name
+
+    Args:
+        file (Path): Path to the survey CSV (or its name within a zip file)
+        out_dir (Path): Path to directory in which data will be saved
+        key_df (DataFrame): Key loaded by `RedcapSurvey.load_key`
+        file_df (str, optional): Readable CSV if `file` is in a zip file. Defaults to "".
+        output_format (str, optional): One of `OUTPUT_FORMATS`. Defaults to "csv".
+        save (bool, optional): If False, the file isn't saved and its path is returned
+            with its contents. Defaults to True.
+        choices (Union[dict, None], optional): Answer translations of the key's questions
+            (see `RedcapSurvey.load_key`). Built from the form's rows of the key if None. Defaults to None.
+
+    Returns:
+        tuple: (list of messages for the user, path of the saved file
+            (or tuple of path and contents if not `save`) or None if skipped)
+    """
+    # Don't error if this survey isn't in key. Return message and move on
+    this_key = _redcap_key(file, key_df)
+    if this_key is None:
+        return [f"Unable to find match for {file.stem} in key. Skipping..."], None
+
+    # Generate survey object
+    this_survey = RedcapSurvey(
+        file=file, key=this_key, file_df=file_df, choices=choices
+    )
+    this_survey.process()
+
+    # Make out dir in specified path + survey id
+    this_out_dir = out_dir.joinpath(file.stem)
+    if not save:
+        name, data = this_survey.export_data(output_format=output_format)
+        return [], (this_out_dir.joinpath(name), data)
+    this_out_dir.mkdir(exist_ok=True, parents=True)
+    return [], this_survey.export(this_out_dir, output_format=output_format)
+
+
+def _init_survey_worker(key_path, load_beiwe, load_redcap):
+    """Loads survey keys once for this process (used as a process pool initializer)
+
+    Args:
+        key_path (str): Path to Excel key containing survey scoring rules
+        load_beiwe (bool): Load the Beiwe key and compile its scoring plans
+        load_redcap (bool): Load the REDCap key and the answer translations of its questions
+    """
+    _worker_keys.clear()
+    if load_beiwe:
+        _worker_keys["beiwe"] = BeiweSurvey.load_key(key_path, compile_plans=True)
+    if load_redcap:
+        _worker_keys["redcap"] = RedcapSurvey.load_key(key_path, compile_choices=True)
+
+
+def _key_fingerprint(survey_type, file):
+    """Returns the fingerprint of the key entries used to process `file`,
+    so that key edits only invalidate the surveys they affect. Keys come from `_init_survey_worker`.
+
+    Args:
+        survey_type (str): "beiwe" or "redcap"
+        file (Path): Path to the survey CSV (or its name within a zip file)
+
+    Returns:
+        str: Fingerprint of the survey's key entries. None if the survey is not in the key.
+    """
+    if survey_type == "redcap":
+        this_key = _redcap_key(file, _worker_keys["redcap"][0])
+        return None if this_key is None else fingerprint(this_key.to_dict("records"))
+    plan = _worker_keys["beiwe"][1].get(file.parent.name)
+    return None if plan is None else plan.fingerprint
+
+
+def _read_task(task):
+    """Reads the file of a task from `process_survey`
+
+    Args:
+        task (tuple): (survey type ("beiwe" or "redcap"), path to CSV or name within zip,
+            path to zip or None, `ZipInfo` of the CSV within the zip or None)
+
+    Returns:
+        bytes: Contents of the CSV
+    """
+    _, name, zip_path, info = task
+    if zip_path is None:
+        return Path(name).read_bytes()
+    # Members are read from their offsets, so the zip file isn't parsed for every member
+    return read_zip_member(zip_path, info)
+
+
+def _batch_tasks(tasks, batch_size=SCORE_BATCH_SIZE):
+    """Groups consecutive Beiwe tasks of `process_survey` that share a survey ID,
+    so they can be scored together. REDCap tasks are processed alone.
+
+    Args:
+        tasks (list): Tasks of `process_survey` (see `_read_task`)
+        batch_size (int, optional): Maximum number of tasks per batch. Defaults to SCORE_BATCH_SIZE.
+
+    Returns:
+        list: Lists of tasks, in the order of `tasks`
+    """
+    batches = []
+    prev_id = None
+    for task in tasks:
+        this_id = Path(task[1]).parent.name if task[0] == "beiwe" else None
+        if this_id is None or this_id != prev_id or len(batches[-1]) >= batch_size:
+            batches.append([])
+        batches[-1].append(task)
+        prev_id = this_id
+    return batches
+
+
+def _read_batches(batches, depth=PREFETCH_DEPTH, max_mb=PREFETCH_MB):
+    """Reads the files of `batches` ahead while earlier batches are processed (see `prefetch`)
+
+    Args:
+        batches (list): Batches from `_batch_tasks`
+        depth (int, optional): Maximum number of files read ahead. Defaults to PREFETCH_DEPTH.
+        max_mb (float, optional): Maximum megabytes of files read ahead. Defaults to PREFETCH_MB.
+
+    Yields:
+        tuple: (batch, list of contents of its files)
+    """
+    reads = prefetch(
+        (task for batch in batches for task in batch), _read_task, depth, max_mb
+    )
+    try:
+        for batch in batches:
+            yield batch, [next(reads)[1] for _ in batch]
+    finally:
+        reads.close()
+
+
+def _process_survey_batch(
+    batch,
+    out_dir,
+    subject_ids,
+    survey_ids,
+    output_format="csv",
+    output_layout="files",
+    save=True,
+    data=None,
+    compact=False,
+):
+    """Processes files found by `process_survey`. Keys come from `_init_survey_worker`.
+
+    Args:
+        batch (list): Tasks from `_batch_tasks`. Each is (survey type ("beiwe" or "redcap"),
+            path to CSV or name within zip, path to zip or None, `ZipInfo` of the CSV within the zip or None)
+        out_dir (Path): Path to directory in which data will be saved
+        subject_ids (list): List of subject IDs to process
+        survey_ids (list): List of survey IDs to process
+        output_format (str, optional): One of `OUTPUT_FORMATS`. Defaults to "csv".
+        output_layout (str, optional): One of `OUTPUT_LAYOUTS`. Defaults to "files".
+        save (bool, optional): Save the output files (see `process_beiwe`). Defaults to True.
+        data (list, optional): Contents of each CSV if already read. Defaults to None.
+        compact (bool, optional): Load Beiwe CSVs with less memory (see `read_survey_csv`). Defaults to False.
+
+    Returns:
+        list: For each task, (list of messages for the user, path of the saved file
+            (or path and contents, or DataFrame of dataset rows, see `process_beiwe`) or None if skipped,
+            content hash of the CSV or None if it is in a zip file)
+    """
+    # Read once so the same bytes are hashed and parsed
+    if data is None:
+        data = [_read_task(task) for task in batch]
+    # The CRC stored in a zip file is used as the hash of its CSVs
+    digests = [
+        manifest.file_digest(contents) if zip_path is None else None
+        for (_, _, zip_path, _), contents in zip(batch, data)
+    ]
+
+    if batch[0][0] == "redcap":
+        outputs = [
+            process_redcap(
+                Path(batch[0][1]),
+                out_dir,
+                _worker_keys["redcap"][0],
+                file_df=io.BytesIO(data[0]),
+                output_format=output_format,
+                save=save,
+                choices=_worker_keys["redcap"][1],
+            )
+        ]
+    else:
+        outputs = process_beiwe_many(
+            [Path(task[1]) for task in batch],
+            out_dir,
+            *_worker_keys["beiwe"],
+            subject_ids=subject_ids,
+            survey_ids=survey_ids,
+            file_dfs=[io.BytesIO(contents) for contents in data],
+            output_format=output_format,
+            output_layout=output_layout,
+            save=save,
+            compact=compact,
+        )
+    return [
+        (messages, out_path, digest)
+        for (messages, out_path), digest in zip(outputs, digests)
+    ]
+
+
+def _remove_output(out, entry, upserts):
+    """Removes the output recorded in a manifest entry of `process_survey`.
+    Instances in dataset partitions are queued for removal in `upserts` instead.
+
+    Args:
+        out (OutputDir or OutputArchive): Saved outputs
+        entry (dict): Manifest entry
+        upserts (dict): Keys = partition paths (relative to `out_dir`),
+            values = (dict of instance -> DataFrame of rows to add, set of instances to remove)
+    """
+    if "instance" in entry:
+        upserts.setdefault(entry["output"], ({}, set()))[1].add(entry["instance"])
+    else:
+        out.remove(entry["output"])
+
+
+def _find_survey_files(data_dir, skip_dirs, extensions, subject_ids, survey_ids):
+    """Finds the files in `data_dir` that `process_survey` may process without
+    descending into directories that can't contain selected surveys.
+    Relies on the Beiwe layout `<subject>/survey_answers/<survey_id>/`,
+    so directories of non-selected subjects and survey IDs are never listed.
+    A subject's other data streams (e.g. "gps") are skipped as well.
+
+    Args:
+        data_dir (Path): Path to root directory where data is stored
+        skip_dirs (list): Names of directories (or files) to skip
+        extensions (set): File extensions to return
+        subject_ids (list): List of subject IDs to process. None for all.
+        survey_ids (list): List of survey IDs to process. None for all.
+
+    Yields:
+        Path: Path to a file with one of `extensions`
+    """
+    skip_dirs = set(skip_dirs)
+    stack = [Path(data_dir)]
+    while stack:
+        this_dir = stack.pop()
+        with os.scandir(this_dir) as it:
+            entries = sorted(
+                (entry for entry in it if entry.name not in skip_dirs),
+                key=lambda entry: entry.name,
+            )
+        dirs = [entry for entry in entries if entry.is_dir()]
+
+        # Subject directory
+        if any(entry.name == "survey_answers" for entry in dirs):
+            if subject_ids is not None and this_dir.name not in subject_ids:
+                continue
+            dirs = [
+                entry
+                for entry in dirs
+                if entry.name == "survey_answers" or "redcap" in entry.name.lower()
+            ]
+        # Children are survey ID directories
+        elif this_dir.name == "survey_answers" and survey_ids is not None:
+            dirs = [entry for entry in dirs if entry.name in survey_ids]
+
+        for entry in entries:
+            if os.path.splitext(entry.name)[1] in extensions and not entry.is_dir():
+                yield Path(entry.path)
+        stack.extend(Path(entry.path) for entry in reversed(dirs))
+
+
+def _is_selected(survey_type, file, subject_ids, survey_ids, only_redcap, only_beiwe):
+    """Checks whether a file found by `process_survey` should be processed
+
+    Args:
+        survey_type (str): "beiwe" or "redcap"
+        file (Path): Path to the survey CSV (or its name within a zip file)
+        subject_ids (list): List of subject IDs to process
+        survey_ids (list): List of survey IDs to process
+        only_redcap (bool): Only process redcap data
+        only_beiwe (bool): Only process beiwe data
+
+    Returns:
+        bool: True if the file should be processed
+    """
+    if survey_type == "redcap":
+        return not only_beiwe
+    # Standard file structure for Beiwe downloads
+    return (
+        not only_redcap
+        and (subject_ids is None or file.parent.parent.parent.name in subject_ids)
+        and (survey_ids is None or file.parent.name in survey_ids)
+    )
 
 
 def process_survey(
@@ -29,13 +520,29 @@ def process_survey(
     use_zips,
     only_redcap,
     only_beiwe,
+    workers=1,
+    full=False,
+    prefetch_depth=PREFETCH_DEPTH,
+    prefetch_mb=PREFETCH_MB,
+    output_format="csv",
+    output_layout="files",
+    compact=False,
 ):
     """Create a cleaned and scored copy of all survey CSVs in `data_dir`
-    saved in `out_dir` by survey ID
+    saved in `out_dir` by survey ID.
+    Files are tracked in a manifest saved in `out_dir`, so files that are unchanged
+    since the last run (and whose survey's key entries are unchanged) are skipped
+    and outputs of files that no longer exist are removed.
+    With the "dataset" layout, Beiwe surveys are saved as one dataset per survey ID
+    with one file per subject (`<survey_id>/dataset/<subject_id>.<format>`) whose rows
+    also hold the subject ID, date, time, source file ("instance") and status.
+    Reprocessing a file replaces its rows, so datasets never hold duplicates.
+    If `out_dir` ends with ".zip" or ".tar", outputs are saved in that archive instead,
+    with the same paths as in a directory.
 
     Args:
         data_dir (str): Path to root directory where data is stored
-        out_dir (str): Path to directory in which data will be saved
+        out_dir (str): Path to directory (or zip or tar archive) in which data will be saved
         key_path (str): Path to CSV key containing survey scoring rules
         subject_ids (list, optional): List of subject IDs to process. Defaults to None.
         survey_ids (list, optional): List of survey IDs to process. Defaults to None.
@@ -43,148 +550,282 @@ def process_survey(
         use_zips (bool, optional): Flag to process CSVs in zip files within `data_dir`. Defaults to False.
         only_redcap (bool, optional): Only process redcap data. Mutually exclusive with "only_beiwe". Defaults to False.
         only_beiwe (bool, optional): Only process beiwe data. Mutually exclusive with "only_redcap". Defaults to False.
+        workers (int, optional): Number of processes used to process files. Defaults to 1 (no process pool).
+        full (bool, optional): Process all files, even if they are unchanged since the last run. Defaults to False.
+        prefetch_depth (int, optional): Number of files read ahead while processing (see `prefetch`).
+            Only used without a process pool. Defaults to PREFETCH_DEPTH.
+        prefetch_mb (float, optional): Maximum megabytes of files read ahead. Defaults to PREFETCH_MB.
+        output_format (str, optional): One of `OUTPUT_FORMATS`. "parquet" requires pyarrow. Defaults to "csv".
+        output_layout (str, optional): One of `OUTPUT_LAYOUTS`. REDCap exports are always saved as files.
+            Defaults to "files".
+        compact (bool, optional): Load Beiwe CSVs with less memory (see `read_survey_csv`).
+            Only the question and answer columns are kept. Defaults to False.
     """
     # Mutually exclusive input checking (redundant b/c checked by argparse)
     if only_redcap and only_beiwe:
         raise Exception(
             "'only_redcap' and 'only_beiwe' are mutually exclusive flags. If you wish to process both survey types, specify neither of these."
         )
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"'output_format' must be one of {OUTPUT_FORMATS}")
+    if output_format == "parquet":
+        require_parquet()
+    if output_layout not in OUTPUT_LAYOUTS:
+        raise ValueError(f"'output_layout' must be one of {OUTPUT_LAYOUTS}")
     # Best practice to default to None in function definition
     skip_dirs = [] if skip_dirs is None else skip_dirs
 
     # Setup
+    data_dir = Path(data_dir)
     out_dir = Path(out_dir)
-    out_dir.mkdir(exist_ok=True)
+    to_archive = is_archive(out_dir)
+    if not to_archive:
+        out_dir.mkdir(exist_ok=True)
     extensions = (
         {".csv", ".zip"} if use_zips else {".csv"}
     )  # zip file control is done here
     # Exclude the to-be-created dir to be safe (user may be intending to overwrite without deleting the folder first)
-    skip_dirs.append(out_dir.stem)
-
-    # Set as None initially for efficient checking
-    key_redcap = None
-    key_beiwe = None
-
-    ###### Inner funcs
-    def process_beiwe(file, key_df):
-        # Don't error if this survey isn't in key. Print message and move on
-        try:
-            this_key = key_df[file.parent.name]
-        except KeyError:
-            print(f"Survey ID '{file.parent.name}' not found in key. Skipping...")
-            return
-
-        # Standard file structure for Beiwe downloads
-        this_subj_id = file.parent.parent.parent.name
-
-        if (subject_ids is not None and this_subj_id not in subject_ids) or (
-            survey_ids is not None and file.parent.name not in survey_ids
-        ):
-            return
-
-        # Make out dir in specified path + survey id
-        this_out_dir = out_dir.joinpath(file.parent.name)
-        this_out_dir.mkdir(exist_ok=True, parents=True)
+    skip_dirs.append(out_dir.name if to_archive else out_dir.stem)
+    select_args = (subject_ids, survey_ids, only_redcap, only_beiwe)
+    out = open_output(out_dir)
+    entries = manifest.load_manifest(out)
+    previous_entries = dict(entries)
+
+    ###### Find files -- Walk data_dir, pruning directories that hold no selected surveys
+    # ((survey type, file, zip file or None, ZipInfo or None), input id, stat)
+    found = []
+    for item in _find_survey_files(
+        data_dir, skip_dirs, extensions, subject_ids, survey_ids
+    ):
+        # Zip needs secondary loop. It is treated as a top-level dir
+        # Its members are listed once here and read by `_read_task` from their offsets
+        if item.suffix == ".zip":
+            with zipfile.ZipFile(item) as zf:
+                infos = zf.infolist()
+            # Go through every file (name) in zip file
+            for info in infos:
+                name = info.filename
+                # Skips "__MACOS" folders and non-csv files
+                if name.startswith("__") or not name.endswith(".csv"):
+                    continue
+                survey_type = (
+                    "redcap" if "redcap" in Path(name).parent.stem.lower() else "beiwe"
+                )
+                if _is_selected(survey_type, Path(name), *select_args):
+                    found.append(
+                        (
+                            (survey_type, name, item, info),
+                            manifest.input_id(data_dir, item, name),
+                            manifest.zip_member_stat(info),
+                        )
+                    )
+        else:
+            survey_type = "redcap" if "redcap" in item.parent.stem.lower() else "beiwe"
+            if _is_selected(survey_type, item, *select_args):
+                found.append(
+                    (
+                        (survey_type, item, None, None),
+                        manifest.input_id(data_dir, item),
+                        manifest.file_stat(item),
+                    )
+                )
 
-        # Generate survey object
-        this_survey = (
-            BeiweSurvey(
-                file=file,
-                key=this_key,
-                subject_id=this_subj_id,
-                file_df=zf.open(name),
-            )  # zip file requires special handling
-            if item.suffix == ".zip"
-            else BeiweSurvey(file=file, key=this_key, subject_id=this_subj_id)
+    ###### Skip files that are unchanged since the last run
+    # Keys are loaded once per process and only if needed. Here they are used for fingerprints.
+    init_args = (
+        key_path,
+        any(task[0] == "beiwe" for task, _, _ in found),
+        any(task[0] == "redcap" for task, _, _ in found),
+    )
+    _init_survey_worker(*init_args)
+    pending = []
+    for task, this_id, stat in found:
+        entry = entries.get(this_id)
+        key_fp = _key_fingerprint(task[0], Path(task[1]))
+        csv_path = task[1] if task[2] is None else None
+        # Beiwe outputs saved with the other layout are replaced
+        same_layout = (
+            entry is None
+            or task[0] == "redcap"
+            or ("instance" in entry) == (output_layout == "dataset")
         )
-
-        # If there is no scoring to be done, just clean and save survey
-        if this_key["index"] is None and this_key["invert"] is None:
-            this_survey.clean_to_save()
+        if (
+            not full
+            and same_layout
+            and manifest.is_current(
+                entry, stat, key_fp, out, csv_path, "." + output_format
+            )
+        ):
+            # Content is unchanged, but the modification time may not be
+            entries[this_id] = entry | stat
         else:
-            this_survey.parse_and_score()
-        this_survey.export(this_out_dir)
+            pending.append((task, this_id, stat | {"key": key_fp}))
+    if len(pending) < len(found):
+        print(
+            f"{len(found) - len(pending)} of {len(found)} files are unchanged since the last run. Skipping..."
+        )
 
-    def process_redcap(file, key_df):
-        # Don't error if this survey isn't in key. Print message and move on
-        this_name = next(
-            (form for form in key_df["Form Name"].unique() if form in file.stem), None
+    ###### Process files -- Instances of the same survey are scored in batches
+    batches = _batch_tasks([task for task, _, _ in pending])
+    run_batch = partial(
+        _process_survey_batch,
+        out_dir=out_dir,
+        subject_ids=subject_ids,
+        survey_ids=survey_ids,
+        output_format=output_format,
+        output_layout=output_layout,
+        # Archives are written by this process only
+        save=not to_archive,
+        compact=compact,
+    )
+    if workers > 1 and len(batches) > 1:
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_survey_worker,
+            initargs=init_args,
+        )
+        # map returns results in task order, so output is deterministic
+        results = executor.map(
+            run_batch, batches, chunksize=max(1, len(batches) // (workers * 4))
         )
-        if this_name is None:
-            print(f"Unable to find match for {file.stem} in key. Skipping...")
-            return
+    else:
+        executor = nullcontext()
+        # Reads upcoming files while the current batch is processed
+        results = (
+            run_batch(batch, data=data)
+            for batch, data in _read_batches(batches, prefetch_depth, prefetch_mb)
+        )
+    # One result per task
+    results = (result for batch_results in results for result in batch_results)
+
+    upserts = {}  # Dataset partition -> (rows to add, instances to remove)
+    with executor:
+        for (task, this_id, stat), (messages, output, digest) in zip(pending, results):
+            for message in messages:
+                print(message)
+            old_entry = entries.pop(this_id, None)
+            new_entry = {}
+            if isinstance(output, pd.DataFrame):
+                file = Path(task[1])
+                partition = partition_path(
+                    file.parent.name, file.parent.parent.parent.name, output_format
+                ).as_posix()
+                upserts.setdefault(partition, ({}, set()))[0][file.stem] = output
+                new_entry = {"output": partition, "instance": file.stem}
+            elif output is not None:
+                if to_archive:
+                    output, data = output
+                    out.write(output.relative_to(out_dir).as_posix(), data)
+                new_entry = {"output": output.relative_to(out_dir).as_posix()}
+            if new_entry:
+                entries[this_id] = (
+                    stat
+                    | {"hash": stat["hash"] if digest is None else digest}
+                    | new_entry
+                )
+            # Output name depends on the scores, so it may have changed
+            if old_entry is not None and any(
+                old_entry.get(k) != new_entry.get(k) for k in ("output", "instance")
+            ):
+                _remove_output(out, old_entry, upserts)
+
+    ###### Remove outputs of files that no longer exist
+    found_ids = {this_id for _, this_id, _ in found}
+    for this_id in list(entries):
+        if this_id not in found_ids and not manifest.input_exists(data_dir, this_id):
+            _remove_output(out, entries.pop(this_id), upserts)
+            print(f"{this_id} no longer exists. Its output has been removed.")
+
+    ###### Update datasets. Each partition is rewritten once per run.
+    for partition, (add, remove) in sorted(upserts.items()):
+        upsert_partition(
+            out,
+            partition,
+            pd.concat(add.values(), ignore_index=True) if add else None,
+            remove,
+        )
+    # Archives are rewritten when anything changes, so unchanged runs leave them as is
+    if entries != previous_entries or not out.exists(manifest.MANIFEST_NAME):
+        manifest.save_manifest(out, entries)
+    out.close()
 
-        this_key = key_df[key_df["Form Name"].str.contains(this_name)]
 
-        # Make out dir in specified path + survey id
-        this_out_dir = out_dir.joinpath(file.stem)
-        this_out_dir.mkdir(exist_ok=True, parents=True)
+def aggregate_survey(
+    data_dir,
+    out_dir,
+    key_path,
+    out_name,
+    prefetch_depth=PREFETCH_DEPTH,
+    prefetch_mb=PREFETCH_MB,
+    legacy_summary=False,
+    summary_export="excel",
+    output_format="csv",
+    stats_only=False,
+):
+    """Summarizes all data processed by `process_survey` (see `aggregate_beiwe` and `aggregate_redcap`)
 
-        # Generate survey object
-        this_survey = (
-            RedcapSurvey(
-                file=file,
-                key=this_key,
-                file_df=zf.open(name),
-            )  # zip file requires special handling
-            if item.suffix == ".zip"
-            else RedcapSurvey(file=file, key=this_key)
+    Args:
+        data_dir (str): Path to directory (or archive) in which processed data exists
+        out_dir (str): Directory to which the summary should be saved
+        key_path (str): Path to Excel key containing survey scoring rules
+        out_name (str): Name of the summary (without suffix)
+        prefetch_depth (int, optional): Number of files read ahead (see `prefetch`). Defaults to PREFETCH_DEPTH.
+        prefetch_mb (float, optional): Maximum megabytes of files read ahead. Defaults to PREFETCH_MB.
+        legacy_summary (bool, optional): See `aggregate_beiwe`. Defaults to False.
+        summary_export (str, optional): One of `SUMMARY_EXPORTS`. "excel" saves one workbook with pandas.
+            "stream" saves one workbook with `write_workbook` and "bundle" a directory named `out_name`
+            (see `write_bundle`), both written one tab at a time as the surveys are read
+            (see `beiwe_sheets` and `redcap_sheets`), so only one survey's tab is held in memory.
+            Defaults to "excel".
+        output_format (str, optional): One of `OUTPUT_FORMATS`. Format of the files of a bundle. Defaults to "csv".
+        stats_only (bool, optional): Only save the Beiwe statistics, reading only the outputs that are new
+            or changed since the last run (see `aggregate_beiwe`). Defaults to False.
+    """
+    if summary_export not in SUMMARY_EXPORTS:
+        raise ValueError(f"'summary_export' must be one of {SUMMARY_EXPORTS}")
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"'output_format' must be one of {OUTPUT_FORMATS}")
+    if summary_export == "bundle" and output_format == "parquet":
+        require_parquet()
+
+    if summary_export != "excel":
+        # Tabs are written as they are read. The summary and statistics tabs are placed first
+        # but only come once every Beiwe survey is read.
+        sheets = beiwe_sheets(
+            data_dir, key_path, prefetch_depth, prefetch_mb, legacy_summary, stats_only
         )
+        first = ["Beiwe Stats"]
+        if not stats_only:
+            first = ["Beiwe Summary", "Beiwe Stats"]
+            # As in the workbook saved by pandas, a Beiwe survey replaces the REDCap form of the same name
+            sheets = chain(
+                redcap_sheets(
+                    data_dir,
+                    key_path,
+                    prefetch_depth,
+                    prefetch_mb,
+                    skip=beiwe_survey_names(data_dir, key_path),
+                ),
+                sheets,
+            )
+        if summary_export == "bundle":
+            write_bundle(Path(out_dir).joinpath(out_name), sheets, output_format, first)
+        else:
+            write_workbook(Path(out_dir).joinpath(out_name + ".xlsx"), sheets, first)
+        return
 
-        # If there is no scoring to be done, just clean and save survey
-        this_survey.process()
-        this_survey.export(this_out_dir)
-
-    ###### Main func -- Iterate recursively through everything in data_dir
-    for item in Path(data_dir).glob("**/*"):
-        # Check that this item is not meant to be skipped and that it the file extension is intended
-        if set(item.parts) & set(skip_dirs) or item.suffix not in extensions:
-            continue
-
-        # Zip needs secondary loop. It is treated as a top-level dir
-        if item.suffix == ".zip":
-            zf = zipfile.ZipFile(item)
-            # Go through every file (name) in zip file
-            for name in zf.namelist():
-                # Skips "__MACOS" folders and non-csv files
-                if name.startswith("__") or not name.endswith(".csv"):
-                    continue
-                elif "redcap" in Path(name).parent.stem.lower():
-                    if only_beiwe:
-                        continue
-                    else:
-                        if key_redcap is None:
-                            key_redcap = RedcapSurvey.load_key(key_path)
-                        process_redcap(Path(name), key_redcap)
-                elif not only_redcap:
-                    if key_beiwe is None:
-                        key_beiwe = BeiweSurvey.load_key(key_path)
-                    process_beiwe(Path(name), key_beiwe)
-        elif item.suffix == ".csv":
-            # If it's a redcap survey
-            if "redcap" in item.parent.stem.lower():
-                if only_beiwe:  # Skip if only supposed to process Beiwe
-                    continue
-                else:
-                    # Only load key once
-                    if key_redcap is None:
-                        key_redcap = RedcapSurvey.load_key(key_path)
-                    process_redcap(item, key_redcap)
-            elif (
-                not only_redcap
-            ):  # Not a redcap survey and not only supposed to process redcap
-                # Only load key once
-                if key_beiwe is None:
-                    key_beiwe = BeiweSurvey.load_key(key_path)
-                process_beiwe(item, key_beiwe)
-
-
-def aggregate_survey(data_dir, out_dir, key_path, out_name):
-    beiwe_summary, beiwe_stats, beiwe_agg_dict = aggregate_beiwe(data_dir, key_path)
-    redcap_agg_dict = aggregate_redcap(data_dir, key_path)
-
-    # Combine
-    agg_dict = redcap_agg_dict | beiwe_agg_dict
+    beiwe_summary, beiwe_stats, beiwe_agg_dict = aggregate_beiwe(
+        data_dir, key_path, prefetch_depth, prefetch_mb, legacy_summary, stats_only
+    )
+    if stats_only:
+        sheets = {"Beiwe Stats": beiwe_stats}
+    else:
+        redcap_agg_dict = aggregate_redcap(
+            data_dir, key_path, prefetch_depth, prefetch_mb
+        )
+        # Combine
+        sheets = {"Beiwe Summary": beiwe_summary, "Beiwe Stats": beiwe_stats}
+        sheets.update(redcap_agg_dict | beiwe_agg_dict)
 
     # Write
     with pd.ExcelWriter(
@@ -192,9 +833,7 @@ def aggregate_survey(data_dir, out_dir, key_path, out_name):
         engine="xlsxwriter",
         engine_kwargs={"options": {"strings_to_numbers": True}},
     ) as writer:
-        beiwe_summary.to_excel(writer, sheet_name="Beiwe Summary", index=False)
-        beiwe_stats.to_excel(writer, sheet_name="Beiwe Stats", index=False)
-        for name, df in agg_dict.items():
+        for name, df in sheets.items():
             df.to_excel(writer, sheet_name=name, index=False)
 
 
@@ -356,67 +995,30 @@ def process_gps(data_dir, out_dir, subject_ids, quality_thresh):
         )
 
 
-def aggregate_gps(data_dir, out_dir, out_name):
+def aggregate_gps(data_dir, out_dir, out_name, windows=(30,), strategies=("first",)):
     """Collects data from `process_gps` in `data_dir` into a summary sheet in `out_dir`.
+    Each subject's data are averaged over windows of consecutive days (see `window_summary`).
 
     Args:
         data_dir (str): Path to directory in which data exists
         out_dir (str): Path to directory into which summary will be saved
         out_name (str, optional): Name of the summary file. Defaults to "GPS_SUMMARY".
+        windows (list, optional): Numbers of consecutive days to average over. Defaults to (30,).
+        strategies (list, optional): How the window of each length is picked.
+            Items of `WINDOW_STRATEGIES`. Defaults to ("first",).
     """
+    for strategy in strategies:
+        if strategy not in WINDOW_STRATEGIES:
+            raise ValueError(f"Strategies must be in {WINDOW_STRATEGIES}")
+
     out_dir = Path(out_dir)
     out_dir.mkdir(exist_ok=True)
 
     df_list = []
     for file in Path(data_dir).glob("**/*.csv"):
-        this_id = file.stem
-        df = pd.read_csv(file)
-        n_cont_days_search = 30
-        n_cont_days_found, start_day, end_day = find_n_cont_days(
-            df, n=n_cont_days_search
-        )
-        has_thirty_cont_days = n_cont_days_found == n_cont_days_search
-
-        if has_thirty_cont_days:
-            # Get day number and real date of continuous period
-            obs_day_start_num = day_to_obs_day(df, start_day)
-            obs_day_end_num = day_to_obs_day(df, end_day)
-            obs_day_start_str = date_series_to_str(start_day)
-            obs_day_end_str = date_series_to_str(end_day)
-
-            # Get indices of beginning and end datapoints of thirty day period
-            df_start_ind = df.index[
-                (df[["year", "month", "day"]] == start_day).all(axis=1)
-            ].min()
-            df_end_ind = df.index[
-                (df[["year", "month", "day"]] == end_day).all(axis=1)
-            ].max()
-
-            # Get average for only the thirty day period, convert back to DF, rename columns
-            df_avg = (
-                df.drop(["year", "month", "day", "hour"], axis=1)
-                .iloc[df_start_ind:df_end_ind, :]
-                .mean()
-                .to_frame()
-                .T.add_suffix("_mean")
-            )
-        else:
-            obs_day_start_num = obs_day_end_num = obs_day_start_str = (
-                obs_day_end_str
-            ) = None
-            df_avg = pd.DataFrame()
-
-        # Add subject_id column and continuous period info and append to list
-        df_avg.insert(0, "subject_id", [this_id])
-        df_list.append(
-            df_avg.assign(
-                thirty_days_continuous=has_thirty_cont_days,
-                continuous_obs_start_date=obs_day_start_str,
-                continuous_obs_end_date=obs_day_end_str,
-                continuous_obs_start_study_date=obs_day_start_num,
-                continuous_obs_end_study_date=obs_day_end_num,
-            )
-        )
+        df_summary = window_summary(pd.read_csv(file), windows, strategies)
+        df_summary.insert(0, "subject_id", [file.stem])
+        df_list.append(df_summary)
 
     # Combine all dfs and export
     df_out = pd.concat(df_list, axis=0)
@@ -484,6 +1086,13 @@ def process_survey_cli():
     me_group = parser.add_mutually_exclusive_group()
     me_group.add_argument("--only_beiwe", action="store_true")
     me_group.add_argument("--only_redcap", action="store_true")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--full", action="store_true")
+    parser.add_argument("--prefetch_depth", type=int, default=PREFETCH_DEPTH)
+    parser.add_argument("--prefetch_mb", type=float, default=PREFETCH_MB)
+    parser.add_argument("--output_format", choices=OUTPUT_FORMATS, default="csv")
+    parser.add_argument("--output_layout", choices=OUTPUT_LAYOUTS, default="files")
+    parser.add_argument("--compact", action="store_true")
     parser.set_defaults(func=process_survey)
 
     args = parser.parse_args()
@@ -498,6 +1107,13 @@ def process_survey_cli():
         args.use_zips,
         args.only_redcap,
         args.only_beiwe,
+        args.workers,
+        args.full,
+        args.prefetch_depth,
+        args.prefetch_mb,
+        args.output_format,
+        args.output_layout,
+        args.compact,
     )
     print("Complete!")
 
@@ -505,10 +1121,37 @@ def process_survey_cli():
 def agg_survey_cli():
     parent_parser = get_parent_parser(key_path=True, out_name="SURVEY_SUMMARY")
     parser = argparse.ArgumentParser("aggregate_survey", parents=[parent_parser])
+    parser.add_argument("--prefetch_depth", type=int, default=PREFETCH_DEPTH)
+    parser.add_argument("--prefetch_mb", type=float, default=PREFETCH_MB)
+    parser.add_argument("--legacy_summary", action="store_true")
+    parser.add_argument(
+        "--summary_export",
+        type=str,
+        choices=SUMMARY_EXPORTS,
+        default="excel",
+        help="excel: workbook written by pandas. stream: workbook written row by row by xlsxwriter "
+        "in constant memory mode, one survey at a time as it is read. "
+        "bundle: one file per tab plus an index workbook, also written one survey at a time.",
+    )
+    parser.add_argument(
+        "--output_format", type=str, choices=OUTPUT_FORMATS, default="csv"
+    )
+    parser.add_argument("--stats_only", action="store_true")
     parser.set_defaults(func=aggregate_survey)
     args = parser.parse_args()
     disp_run_info(args)
-    args.func(args.data_dir, args.out_dir, args.key_path, args.out_name)
+    args.func(
+        args.data_dir,
+        args.out_dir,
+        args.key_path,
+        args.out_name,
+        args.prefetch_depth,
+        args.prefetch_mb,
+        args.legacy_summary,
+        args.summary_export,
+        args.output_format,
+        args.stats_only,
+    )
     print("Complete!")
 
 
@@ -538,10 +1181,14 @@ def process_gps_cli():
 def agg_gps_cli():
     parent_parser = get_parent_parser(key_path=False, out_name="GPS_SUMMARY")
     parser = argparse.ArgumentParser("aggregate_gps", parents=[parent_parser])
+    parser.add_argument("--windows", type=int, nargs="+", default=[30])
+    parser.add_argument(
+        "--strategies", nargs="+", choices=WINDOW_STRATEGIES, default=["first"]
+    )
     parser.set_defaults(func=aggregate_gps)
     args = parser.parse_args()
     disp_run_info(args)
-    args.func(args.data_dir, args.out_dir, args.out_name)
+    args.func(args.data_dir, args.out_dir, args.out_name, args.windows, args.strategies)
     print("Complete!")
 
 
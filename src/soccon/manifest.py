@@ -0,0 +1,182 @@
+import json
+import hashlib
+import zipfile
+
+from pathlib import Path
+
+MANIFEST_NAME = "process_survey_manifest.json"
+MANIFEST_VERSION = 1
+
+# Separates a zip file from the name of a file inside it in input IDs
+ZIP_MEMBER_SEP = "::"
+
+
+def file_digest(data):
+    """Returns the content hash of `data`
+
+    Args:
+        data (bytes): File contents
+
+    Returns:
+        str: Hash of the form "sha256:<hex digest>"
+    """
+    return "sha256:" + hashlib.sha256(data).hexdigest()
+
+
+def input_id(data_dir, path, name=None):
+    """Returns the ID used to identify an input file in the manifest
+
+    Args:
+        data_dir (Path): Root directory where data is stored
+        path (Path): Path to a CSV or zip file within `data_dir`
+        name (str, optional): Name of the CSV within the zip file `path`. Defaults to None.
+
+    Returns:
+        str: Path relative to `data_dir` (joined to `name` by `ZIP_MEMBER_SEP` for zip files)
+    """
+    rel_path = Path(path).relative_to(data_dir).as_posix()
+    return rel_path if name is None else rel_path + ZIP_MEMBER_SEP + name
+
+
+def file_stat(path):
+    """Returns the size and modification time of a file on disk
+
+    Args:
+        path (Path): Path to file
+
+    Returns:
+        dict: Keys = "size", "mtime" (ns)
+    """
+    stat = Path(path).stat()
+    return {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+
+def zip_member_stat(info):
+    """Returns the size, modification time and hash of a file within a zip file.
+    The CRC stored in the zip file is used as its content hash, so nothing is decompressed.
+
+    Args:
+        info (zipfile.ZipInfo): Info of the file within the zip file
+
+    Returns:
+        dict: Keys = "size", "mtime", "hash"
+    """
+    return {
+        "size": info.file_size,
+        "mtime": "{:04d}-{:02d}-{:02d} {:02d}:{:02d}:{:02d}".format(*info.date_time),
+        "hash": f"crc32:{info.CRC:08x}",
+    }
+
+
+def is_current(entry, stat, key_fp, out, path=None, suffix=None):
+    """Checks whether the output recorded in a manifest entry is still up to date.
+    Size and modification time are compared first. If only the modification
+    time changed, the content hash decides (CSVs are only hashed in that case).
+
+    Args:
+        entry (dict): Manifest entry of the input (None if there is none)
+        stat (dict): Current stat of the input from `file_stat` or `zip_member_stat`
+        key_fp (str): Fingerprint of the key entries used to process the input
+        out (OutputDir or OutputArchive): Saved outputs (see `soccon.output.open_output`)
+        path (Path, optional): Path to the input CSV. Required to hash CSVs
+            whose modification time changed. Defaults to None.
+        suffix (str, optional): Required suffix of the output (e.g. ".parquet"). Defaults to None.
+
+    Returns:
+        bool: True if the input does not need to be processed again
+    """
+    if (
+        entry is None
+        or entry["key"] != key_fp
+        or entry["size"] != stat["size"]
+        or (suffix is not None and Path(entry["output"]).suffix != suffix)
+        or not out.exists(entry["output"])
+    ):
+        return False
+    if entry["mtime"] == stat["mtime"]:
+        return True
+    if "hash" in stat:
+        return entry["hash"] == stat["hash"]
+    if path is None:
+        return False
+    return entry["hash"] == file_digest(Path(path).read_bytes())
+
+
+def input_exists(data_dir, input_id):
+    """Checks whether the input identified by `input_id` still exists
+
+    Args:
+        data_dir (Path): Root directory where data is stored
+        input_id (str): ID from `input_id`
+
+    Returns:
+        bool: True if the file (or file within a zip file) exists
+    """
+    path, _, name = input_id.partition(ZIP_MEMBER_SEP)
+    path = Path(data_dir).joinpath(path)
+    if not name:
+        return path.is_file()
+    try:
+        with zipfile.ZipFile(path) as zf:
+            zf.getinfo(name)
+    except (OSError, KeyError, zipfile.BadZipFile):
+        return False
+    return True
+
+
+def output_fingerprints(entries):
+    """Returns a fingerprint of the inputs behind every output recorded in the manifest.
+    It changes when an input of the output is added, removed, changed or processed with other key entries.
+
+    Args:
+        entries (dict): Keys = input IDs, values = manifest entries (see `load_manifest`)
+
+    Returns:
+        dict: Keys = output names, values = fingerprints of the form "sha256:<hex digest>"
+    """
+    inputs = {}
+    for this_id, entry in entries.items():
+        inputs.setdefault(entry["output"], []).append(
+            [this_id, entry["hash"], entry["key"]]
+        )
+    # Input IDs are unique, so sorting never compares the other fields
+    return {
+        output: file_digest(json.dumps(sorted(x)).encode())
+        for output, x in inputs.items()
+    }
+
+
+def load_manifest(out):
+    """Loads the manifest saved with the outputs of a previous run
+
+    Args:
+        out (OutputDir or OutputArchive): Saved outputs (see `soccon.output.open_output`)
+
+    Returns:
+        dict: Keys = input IDs, values = manifest entries.
+            Empty if there is no (readable) manifest.
+    """
+    try:
+        manifest = json.loads(out.read(MANIFEST_NAME))
+    except (OSError, KeyError, ValueError):
+        return {}
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {}
+    return manifest["inputs"]
+
+
+def save_manifest(out, entries):
+    """Saves the manifest with the outputs. The file is replaced atomically,
+    so an interrupted run leaves the previous manifest intact.
+
+    Args:
+        out (OutputDir or OutputArchive): Saved outputs (see `soccon.output.open_output`)
+        entries (dict): Keys = input IDs, values = manifest entries
+    """
+    out.write(
+        MANIFEST_NAME,
+        json.dumps(
+            {"version": MANIFEST_VERSION, "inputs": dict(sorted(entries.items()))},
+            indent=1,
+        ).encode(),
+    )
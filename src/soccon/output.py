@@ -0,0 +1,550 @@
+import io
+import copy
+import os
+import re
+import time
+import zlib
+import tarfile
+import threading
+import zipfile
+import importlib.util
+import numpy as np
+import pandas as pd
+import xlsxwriter
+from pathlib import Path, PurePosixPath
+from soccon.utils import copy_zip_member
+
+# File formats processed surveys can be saved as
+OUTPUT_FORMATS = ("csv", "parquet")
+
+# Ways processed Beiwe surveys can be saved: one file per survey instance,
+# or one dataset per survey ID with one file per subject (see `upsert_partition`)
+OUTPUT_LAYOUTS = ("files", "dataset")
+
+# Suffixes of archives outputs can be saved in instead of a directory (see `open_output`)
+ARCHIVE_SUFFIXES = (".zip", ".tar")
+
+# Ways `aggregate_survey` can save its summary: one workbook written by pandas,
+# one workbook written directly with xlsxwriter (see `write_workbook`) or files with an index workbook (see `write_bundle`)
+SUMMARY_EXPORTS = ("excel", "stream", "bundle")
+
+# Name of the directory (within the directory of a survey ID) holding its dataset
+DATASET_DIR = "dataset"
+
+# Columns prepended to the rows of a dataset.
+# "instance" is the name of the source file (without suffix) and identifies a survey instance.
+DATASET_COLUMNS = ["subject_id", "date", "time", "instance", "status"]
+
+
+def require_parquet():
+    """Checks that the optional dependency needed for parquet files is installed
+
+    Raises:
+        ImportError: pyarrow is not installed
+    """
+    if importlib.util.find_spec("pyarrow") is None:
+        raise ImportError(
+            "Parquet files require pyarrow. Install it with `pip install pyarrow` or the `parquet` extra of this package."
+        )
+
+
+def to_parquet(df, fpath):
+    """Saves `df` as a compressed parquet file.
+    Scores are saved as (nullable) integers if they are all whole numbers.
+
+    Args:
+        df (DataFrame): Data to save
+        fpath (Path): Path of the file
+    """
+    if "score" in df.columns:
+        score = pd.to_numeric(df["score"], errors="coerce")
+        if (score.dropna() % 1 == 0).all():
+            score = score.astype("Int64")
+        df = df.assign(score=score)
+    # Columns mixing types (e.g. translated and untranslated REDCap answers) are saved as text
+    mixed = [
+        col
+        for col in df.columns
+        if df[col].dtype == object
+        and pd.api.types.infer_dtype(df[col], skipna=True).startswith("mixed")
+    ]
+    df = df.assign(**{col: df[col].map(str, na_action="ignore") for col in mixed})
+    df.to_parquet(fpath, index=False, compression="zstd")
+
+
+def read_output(fpath, data=None):
+    """Reads a CSV or parquet file saved by `BeiweSurvey.export` or `RedcapSurvey.export`
+
+    Args:
+        fpath (Path): Path to the file
+        data (bytes, optional): Contents of the file if already read. Defaults to None.
+
+    Returns:
+        DataFrame: Saved data
+    """
+    source = fpath if data is None else io.BytesIO(data)
+    if Path(fpath).suffix != ".parquet":
+        return pd.read_csv(source)
+    df = pd.read_parquet(source)
+    # Missing scores are NaN, as when reading CSVs
+    if "score" in df.columns and df["score"].dtype == "Int64":
+        df["score"] = df["score"].astype("float64" if df["score"].hasnans else "int64")
+    return df
+
+
+def to_bytes(df, output_format):
+    """Serializes `df` as it is saved by `BeiweSurvey.export` and `RedcapSurvey.export`
+
+    Args:
+        df (DataFrame): Data to save
+        output_format (str): One of `OUTPUT_FORMATS`
+
+    Returns:
+        bytes: Contents of the file
+    """
+    buffer = io.BytesIO()
+    if output_format == "parquet":
+        to_parquet(df, buffer)
+    else:
+        df.to_csv(buffer, index=False, header=True)
+    return buffer.getvalue()
+
+
+def write_workbook(fpath, sheets, first=()):
+    """Writes `sheets` into a workbook row by row with xlsxwriter's constant memory mode.
+    Rows are flushed to disk as they are written, so xlsxwriter doesn't hold a copy of every cell
+    as it does for `pd.ExcelWriter`. `sheets` is consumed one sheet at a time, so when it is a generator
+    (e.g. `soccon.survey.beiwe_sheets`) only the sheet being written is held in memory.
+    As when `aggregate_survey` saves the summary with pandas, strings that are numbers are saved as numbers.
+
+    Args:
+        fpath (Path): Path of the workbook
+        sheets (Iterable): Tuples of sheet name and DataFrame to write (without index)
+        first (Iterable, optional): Names of sheets that are placed first (in this order)
+            wherever they come in `sheets`. Sheets that never come are left empty. Defaults to ().
+    """
+    workbook = xlsxwriter.Workbook(
+        fpath,
+        {
+            "constant_memory": True,
+            "strings_to_numbers": True,
+            "nan_inf_to_errors": True,
+        },
+    )
+    # Same header style as pandas
+    header_format = workbook.add_format(
+        {"bold": True, "border": 1, "align": "center", "valign": "top"}
+    )
+    try:
+        placeholders = {name: workbook.add_worksheet(name) for name in first}
+        for name, df in sheets:
+            if name in placeholders:
+                worksheet = placeholders.pop(name)
+            else:
+                worksheet = workbook.add_worksheet(name)
+            for col, label in enumerate(df.columns):
+                worksheet.write(0, col, str(label), header_format)
+            for row, values in enumerate(df.itertuples(index=False, name=None), 1):
+                for col, value in enumerate(values):
+                    if isinstance(value, np.generic):
+                        value = value.item()
+                    # Missing values are left empty
+                    if value is not None and value is not pd.NA and value == value:
+                        worksheet.write(row, col, value)
+    finally:
+        workbook.close()
+
+
+def write_bundle(dir_path, sheets, output_format="csv", first=()):
+    """Saves every sheet as a file in `dir_path`, with an index workbook ("index.xlsx") listing them.
+    Faster to write and read than one workbook with every sheet.
+    As for `write_workbook`, `sheets` is consumed one sheet at a time.
+
+    Args:
+        dir_path (Path): Directory in which the files are saved
+        sheets (Iterable): Tuples of sheet name and DataFrame to save (without index)
+        output_format (str, optional): One of `OUTPUT_FORMATS`. Defaults to "csv".
+        first (Iterable, optional): Names of sheets listed first in the index (in this order)
+            wherever they come in `sheets`. Defaults to ().
+
+    Returns:
+        Path: Path of the index workbook
+    """
+    dir_path = Path(dir_path)
+    dir_path.mkdir(parents=True, exist_ok=True)
+    index = []
+    for name, df in sheets:
+        # Characters that aren't allowed in file names on Windows are replaced
+        fname = re.sub(r'[\\/:*?"<>|]', "_", name) + "." + output_format
+        if output_format == "parquet":
+            # Parquet needs unique column names (surveys may repeat question texts)
+            df = df.set_axis(unique_columns(df.columns), axis=1)
+        dir_path.joinpath(fname).write_bytes(to_bytes(df, output_format))
+        index.append([name, fname, df.shape[0], df.shape[1]])
+    order = {name: i for i, name in enumerate(first)}
+    index.sort(key=lambda x: order.get(x[0], len(order)))
+    index_path = dir_path.joinpath("index.xlsx")
+    write_workbook(
+        index_path,
+        [("Index", pd.DataFrame(index, columns=["Sheet", "File", "Rows", "Columns"]))],
+    )
+    return index_path
+
+
+def unique_columns(columns):
+    """Makes column names unique (as strings) by appending ".<n>" to the nth repeat of a name
+
+    Args:
+        columns (Iterable): Column names
+
+    Returns:
+        list: Unique column names
+    """
+    seen = {}
+    unique = []
+    for col in map(str, columns):
+        n = seen.get(col, 0)
+        seen[col] = n + 1
+        unique.append(col if n == 0 else f"{col}.{n}")
+    return unique
+
+
+def is_archive(path):
+    """Checks whether outputs at `path` are saved in an archive (see `ARCHIVE_SUFFIXES`)"""
+    return Path(path).suffix in ARCHIVE_SUFFIXES
+
+
+def open_output(path):
+    """Opens the outputs of `process_survey` saved at `path`
+
+    Args:
+        path (Path): Output directory or archive
+
+    Returns:
+        OutputArchive or OutputDir: Outputs. Close them to save changes to archives.
+    """
+    return OutputArchive(path) if is_archive(path) else OutputDir(path)
+
+
+class OutputDir(object):
+    """Outputs saved as files in a directory.
+    Names are paths relative to the directory, separated by "/".
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def names(self):
+        """Returns the names of all saved files (sorted)"""
+        names = []
+        for root, _, files in os.walk(self.path):
+            rel_root = PurePosixPath(Path(root).relative_to(self.path).as_posix())
+            names.extend(rel_root.joinpath(name).as_posix() for name in files)
+        return sorted(names)
+
+    def exists(self, name):
+        return self.path.joinpath(name).is_file()
+
+    def read(self, name):
+        return self.path.joinpath(name).read_bytes()
+
+    def write(self, name, data):
+        """Saves `data` to the file `name`. The file is replaced atomically."""
+        path = self.path.joinpath(name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+
+    def remove(self, name):
+        self.path.joinpath(name).unlink(missing_ok=True)
+
+    def close(self):
+        pass
+
+
+class OutputArchive(object):
+    """Outputs saved as members of a single zip or tar archive.
+    Member names are the paths files would have within an output directory.
+
+    Archives can't be changed in place, so changes are streamed to a new archive
+    next to the existing one. On `close`, members of the existing archive that
+    weren't replaced or removed are copied over as they are (zip members aren't
+    recompressed) and the new archive replaces it, so the existing archive is left intact until then.
+    Writing a member with the same contents as the existing one isn't a change,
+    so the archive is only rewritten if a member was added, changed or removed.
+    Members written since opening the archive can't be read back.
+    Members can be read from several threads at once (e.g. by `prefetch` and the main thread).
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._is_zip = self.path.suffix == ".zip"
+        self._tmp_path = self.path.with_name(self.path.name + ".tmp")
+        self._reader = None
+        self._writer = None
+        # Tar members are read by seeking the one file object of the archive
+        self._read_lock = threading.Lock()
+        # Name -> ZipInfo or TarInfo of the members of the existing archive
+        self._members = {}
+        self._written = set()
+        self._removed = set()
+        if self.path.exists():
+            if self._is_zip:
+                self._reader = zipfile.ZipFile(self.path)
+                members = self._reader.infolist()
+            else:
+                # Indexed once, as tarfile looks members up by name with a linear scan
+                self._reader = tarfile.open(self.path)
+                members = [x for x in self._reader.getmembers() if x.isfile()]
+            self._members = {
+                x.filename if self._is_zip else x.name: x
+                for x in members
+                if not (self._is_zip and x.is_dir())
+            }
+        self._old = set(self._members)
+
+    def names(self):
+        """Returns the names of all members (sorted)"""
+        return sorted((self._old - self._removed) | self._written)
+
+    def exists(self, name):
+        return name in self._written or (
+            name in self._old and name not in self._removed
+        )
+
+    def read(self, name):
+        if not self.exists(name) or name in self._written:
+            raise KeyError(f"'{name}' can't be read from {self.path}")
+        if self._is_zip:
+            # zipfile locks its file object itself
+            return self._reader.read(self._members[name])
+        with self._read_lock:
+            return self._reader.extractfile(self._members[name]).read()
+
+    def _is_unchanged(self, name, data):
+        """Checks whether `data` is the current contents of the existing member `name`"""
+        if name in self._written or name in self._removed or name not in self._old:
+            return False
+        member = self._members[name]
+        if self._is_zip:
+            return member.file_size == len(data) and member.CRC == zlib.crc32(data)
+        return member.size == len(data) and self.read(name) == data
+
+    def _open_writer(self):
+        if self._writer is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._writer = (
+                zipfile.ZipFile(self._tmp_path, "w")
+                if self._is_zip
+                else tarfile.open(self._tmp_path, "w")
+            )
+        return self._writer
+
+    def _add(self, name, data):
+        writer = self._open_writer()
+        if self._is_zip:
+            # Parquet files are already compressed
+            compress_type = (
+                zipfile.ZIP_STORED
+                if name.endswith(".parquet")
+                else zipfile.ZIP_DEFLATED
+            )
+            writer.writestr(name, data, compress_type=compress_type)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = int(time.time())
+            writer.addfile(info, io.BytesIO(data))
+
+    def write(self, name, data):
+        """Adds `data` as the member `name`, replacing any existing member"""
+        if self._is_unchanged(name, data):
+            return
+        self._add(name, data)
+        self._written.add(name)
+
+    def remove(self, name):
+        if name in self._old and name not in self._removed:
+            self._open_writer()
+            self._removed.add(name)
+
+    def close(self):
+        """Copies over the members that are kept and replaces the existing archive"""
+        if self._writer is not None:
+            kept = sorted(self._old - self._removed - self._written)
+            if self._is_zip and kept:
+                with open(self.path, "rb") as src:
+                    for name in kept:
+                        info = self._members[name]
+                        try:
+                            copy_zip_member(src, info, self._writer)
+                        except (AttributeError, zipfile.BadZipFile):
+                            # zipfile internals changed or the member can't be copied as is.
+                            # Recompress it instead (bad members still fail their CRC check here).
+                            self._writer.writestr(
+                                copy.copy(info), self._reader.read(info)
+                            )
+            elif kept:
+                for name in kept:
+                    member = self._members[name]
+                    self._writer.addfile(member, self._reader.extractfile(member))
+            self._writer.close()
+            self._writer = None
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
+            os.replace(self._tmp_path, self.path)
+        elif self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
+
+def partition_path(survey_id, subject_id, output_format):
+    """Returns the path of a subject's partition of a survey dataset
+
+    Args:
+        survey_id (str): Survey ID
+        subject_id (str): Subject ID
+        output_format (str): One of `OUTPUT_FORMATS`
+
+    Returns:
+        Path: Path relative to the output directory
+    """
+    return Path(survey_id, DATASET_DIR, subject_id + "." + output_format)
+
+
+def is_partition(fpath):
+    """Checks whether `fpath` is a dataset partition (see `partition_path`)"""
+    return Path(fpath).parent.name == DATASET_DIR
+
+
+def read_partition(fpath, data=None):
+    """Reads a dataset partition
+
+    Args:
+        fpath (Path): Path to the partition
+        data (bytes, optional): Contents of the file if already read. Defaults to None.
+
+    Returns:
+        DataFrame: Rows of every survey instance in the partition
+    """
+    if Path(fpath).suffix == ".parquet":
+        return read_output(fpath, data)
+    # IDs, dates and times are kept as text, like in file names
+    return pd.read_csv(
+        fpath if data is None else io.BytesIO(data),
+        dtype=dict.fromkeys(DATASET_COLUMNS, str),
+    )
+
+
+def _plain_schema(schema):
+    """Returns `schema` with categorical (dictionary) columns decoded and without pandas metadata,
+    so partitions saved with different column types can be read as one table
+    """
+    import pyarrow as pa
+
+    return pa.schema(
+        [
+            (
+                field.with_type(field.type.value_type)
+                if pa.types.is_dictionary(field.type)
+                else field
+            )
+            for field in schema
+        ]
+    )
+
+
+def read_dataset(out, names):
+    """Reads the partitions of a survey dataset in one pass.
+    Parquet partitions are read as a single pyarrow dataset (column types are unified,
+    e.g. integer scores become floats if any partition has missing or decimal scores).
+    CSV partitions are read one file at a time and come after parquet partitions.
+
+    Args:
+        out (OutputDir or OutputArchive): Outputs holding the dataset (see `open_output`)
+        names (list): Names of the partitions (see `partition_path`)
+
+    Returns:
+        DataFrame: Rows of every partition, in the order of `names`
+    """
+    frames = []
+    parquet_names = [name for name in names if Path(name).suffix == ".parquet"]
+    if parquet_names:
+        # Optional dependency, only needed for parquet files (see `require_parquet`)
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        import pyarrow.parquet as pq
+
+        if isinstance(out, OutputDir):
+            paths = [str(out.path.joinpath(name)) for name in parquet_names]
+            schema = pa.unify_schemas(
+                [_plain_schema(pq.read_schema(path)) for path in paths],
+                promote_options="permissive",
+            )
+            table = ds.dataset(paths, schema=schema, format="parquet").to_table()
+        else:
+            # Members of archives are read into memory and combined there
+            tables = [
+                pq.read_table(pa.BufferReader(out.read(name))) for name in parquet_names
+            ]
+            table = pa.concat_tables(
+                [table.cast(_plain_schema(table.schema)) for table in tables],
+                promote_options="permissive",
+            )
+        frames.append(table.to_pandas())
+    frames.extend(
+        read_partition(name, out.read(name))
+        for name in names
+        if Path(name).suffix != ".parquet"
+    )
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def upsert_partition(out, name, add=None, remove=()):
+    """Replaces survey instances in a dataset partition.
+    Rows of the instances in `add` and `remove` are dropped before `add` is appended,
+    so applying the same update again leaves the partition unchanged.
+    Rows are kept in instance order. Empty partitions are deleted.
+
+    Args:
+        out (OutputDir or OutputArchive): Outputs holding the partition (see `open_output`)
+        name (str): Name of the partition (see `partition_path`)
+        add (DataFrame, optional): Rows to save (with `DATASET_COLUMNS`). Defaults to None.
+        remove (iterable, optional): Instances to remove. Defaults to ().
+    """
+    frames = [] if add is None else [add]
+    if out.exists(name):
+        drop = set(remove) if add is None else set(remove) | set(add["instance"])
+        existing = read_partition(name, out.read(name))
+        frames.insert(0, existing[~existing["instance"].isin(drop)])
+
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    if df.empty:
+        out.remove(name)
+        return
+    df = df.sort_values("instance", kind="stable", ignore_index=True)
+    out.write(name, to_bytes(df, Path(name).suffix[1:]))
+
+
+def partition_instances(df):
+    """Splits a dataset partition (or several, see `read_dataset`) into its survey instances
+
+    Args:
+        df (DataFrame): Partition from `read_partition`
+
+    Yields:
+        tuple: Subject ID, date, time, status and DataFrame of the instance (without `DATASET_COLUMNS`,
+            indexed like the file it was processed from)
+    """
+    # Instances are named by date and time, so they are only unique within a subject
+    for _, this_df in df.groupby(["subject_id", "instance"], sort=False):
+        first = this_df.iloc[0]
+        yield (
+            first["subject_id"],
+            first["date"],
+            first["time"],
+            first["status"],
+            this_df.drop(columns=DATASET_COLUMNS).reset_index(drop=True),
+        )
@@ -1,11 +1,393 @@
+import io
+import os
+import json
+import pickle
+import hashlib
+import numpy as np
 import pandas as pd
-from pathlib import Path
-import re
+from pathlib import Path, PurePosixPath
 from soccon.constants import SURVEY_ANSWER_OPTIONS
-from soccon.utils import row_to_dict
+from soccon import manifest
+from soccon.output import (
+    to_bytes,
+    open_output,
+    read_output,
+    read_partition,
+    read_dataset,
+    is_partition,
+    partition_instances,
+    DATASET_COLUMNS,
+)
+from soccon.utils import (
+    row_to_dict,
+    fingerprint,
+    prefetch,
+    GroupedStats,
+    PREFETCH_DEPTH,
+    PREFETCH_MB,
+)
+
+from functools import reduce, lru_cache
+from itertools import chain, groupby, islice
+
+# Maximum number of distinct answer option strings kept by `parse_answer_options`
+ANSWER_OPTIONS_CACHE_SIZE = 8192
+
+# Bump when the processed key format changes to invalidate caches from `load_key_workbook`
+KEY_CACHE_VERSION = 3
+
+# Statuses of scored surveys. Appended to CSV names, stored in a column in parquet files.
+SCORE_STATUSES = ("SKIPPED_ANS", "PARSE_ERR", "VALIDATION_ERR")
+
+# Columns of Beiwe survey files read by `read_survey_csv`.
+# All but "answer" repeat verbatim in every file of a survey.
+SURVEY_COLUMNS = [
+    "question id",
+    "question type",
+    "question text",
+    "question answer options",
+    "answer",
+]
+REPEATED_COLUMNS = SURVEY_COLUMNS[:-1]
+
+# Keys = survey ID, values = dict (keys = column, values = CategoricalDtype)
+# shared by every file of the survey read by `read_survey_csv` in this process
+_survey_categories = {}
+
+# Columns of the tidy table of survey sums of one survey ID added to the statistics (see `score_stats`)
+SCORE_STATS_COLUMNS = ["Subject ID", "Survey ID", "Survey Name", "date", "sum"]
+
+# Columns of the tab of a survey kept for the summary (see `timepoint_summary`)
+SUMMARY_COLUMNS = ["Subject ID", "date", "time", "sum"]
+
+# File saved with the processed surveys in which `beiwe_sheets` keeps the survey sums of every output,
+# so statistics can be updated without reading unchanged outputs again
+STATS_CACHE_NAME = "aggregate_survey_stats.json"
+STATS_CACHE_VERSION = 1
+
+# Columns of `GroupedStats.result` -> names in the "Beiwe Stats" sheet
+SCORE_STATS_NAMES = {
+    "n": "n",
+    "mean": "Mean",
+    "std": "STD",
+    "median": "Median",
+    "min": "Min",
+    "max": "Max",
+    "first": "First Date",
+    "last": "Last Date",
+    "slope": "Slope",
+}
+
+
+def replace_in_strings(col, replacements):
+    """Replaces substrings in every string of `col` with vectorized string methods.
+    Values that aren't strings are kept as they are.
+
+    Args:
+        col (Series): Values to replace substrings in
+        replacements (list): (old, new) pairs, replaced in order as with `str.replace`
+
+    Returns:
+        Series: `col` with substrings replaced
+    """
+    if isinstance(col.dtype, pd.CategoricalDtype):
+        # Only the (distinct) categories need to be replaced
+        new = replace_in_strings(col.cat.categories.to_series(), replacements)
+        if new.is_unique:
+            return col.cat.rename_categories(new.to_numpy())
+        return col.map(dict(zip(col.cat.categories, new)))
+    if not pd.api.types.is_object_dtype(col):
+        return col
+    new = col
+    for old, repl in replacements:
+        new = new.str.replace(old, repl, regex=False)
+    # `.str` methods return NaN for values that aren't strings
+    return new.where(new.notna(), col)
+
+
+def read_survey_csv(file_df, survey_id):
+    """Reads a Beiwe survey CSV with a fraction of the memory of `pd.read_csv`.
+    Only `SURVEY_COLUMNS` are read. Text columns (always including `REPEATED_COLUMNS`) are read
+    as categoricals whose categories are shared by every file of `survey_id`, so each file only stores codes.
+
+    Args:
+        file_df (str): Path to the CSV or readable CSV (see `BeiweSurvey`)
+        survey_id (str): Survey ID of the file
+
+    Returns:
+        DataFrame: Survey data
+    """
+    df = pd.read_csv(
+        file_df,
+        na_filter=False,
+        usecols=lambda x: x in SURVEY_COLUMNS,
+        dtype={col: str for col in REPEATED_COLUMNS},
+    )
+    categories = _survey_categories.setdefault(survey_id, {})
+    for col in df.columns:
+        # Answers are only text if any of them isn't a number
+        if df[col].dtype != object:
+            continue
+        dtype = categories.get(col)
+        if dtype is None or not df[col].isin(dtype.categories).all():
+            # New values are appended so codes of files already read stay valid
+            known = pd.Index([] if dtype is None else dtype.categories, dtype=object)
+            values = pd.Index(df[col].unique(), dtype=object)
+            dtype = pd.CategoricalDtype(known.append(values[~values.isin(known)]))
+            categories[col] = dtype
+        df[col] = df[col].astype(dtype)
+    return df
+
+
+def split_answer_options(opts):
+    """Splits a string of answer options in a single pass.
+    Beiwe separates options with a semicolon between two non-whitespace characters ("opt 1;opt 2").
+    If no such separator exists, options are assumed to be separated by a semicolon and a space ("opt 1; opt 2").
+    Cannot simply use `split(";")` because options may contain semicolons.
+
+    Args:
+        opts (str): String of answer options
+
+    Returns:
+        list: Answer options
+        bool: True if options were separated by a semicolon and a space
+    """
+    n = len(opts)
+    # Start indices of separators, e.g. "x;y" (width 3) or "x; y" (width 4)
+    # Matches cannot overlap, as with re.finditer(r"\S;\S") and re.finditer(r"\S;\s\S")
+    tight = []
+    spaced = []
+    next_tight = next_spaced = 0
+    sc_ind = opts.find(";", 1)
+    while sc_ind != -1:
+        start = sc_ind - 1
+        if not opts[start].isspace() and sc_ind + 1 < n:
+            after = opts[sc_ind + 1]
+            if not after.isspace():
+                if start >= next_tight:
+                    tight.append(start)
+                    next_tight = start + 3
+            elif (
+                start >= next_spaced
+                and sc_ind + 2 < n
+                and not opts[sc_ind + 2].isspace()
+            ):
+                spaced.append(start)
+                next_spaced = start + 4
+        sc_ind = opts.find(";", sc_ind + 1)
+
+    sc_space_sep = not tight
+    starts, width = (spaced, 4) if sc_space_sep else (tight, 3)
+    if not starts:
+        return [opts], sc_space_sep
+
+    ans_opts = [opts[0 : starts[0] + 1]]  # First option
+    for prev_start, start in zip(starts, starts[1:]):
+        prev_end = prev_start + width
+        if start - prev_end == width - 2:  # Single character option
+            # Take just that character
+            ans_opts.extend([opts[prev_end - 1], opts[start]])
+        else:
+            # End of previous split and start of current one
+            ans_opts.append(opts[prev_end - 1 : start + 1])
+
+    # If remainder starts with a separator, a single character option exists
+    # Extract both single character option and whatever is remaining
+    end = starts[-1] + width
+    if end + 1 < n and opts[end] == ";" and not opts[end + 1].isspace():
+        ans_opts.extend([opts[end - 1], opts[end + 1 :]])
+    elif (
+        end + 2 < n
+        and opts[end] == ";"
+        and opts[end + 1].isspace()
+        and not opts[end + 2].isspace()
+    ):
+        ans_opts.extend([opts[end - 1], opts[end + 2 :]])
+    else:
+        # Final answer option is remainder of "opts"
+        ans_opts.append(opts[end - 1 :])
+    return ans_opts, sc_space_sep
+
+
+@lru_cache(maxsize=ANSWER_OPTIONS_CACHE_SIZE)
+def parse_answer_options(survey_id, question_id, opts, n_ans_options=None):
+    """Extracts the answer options of a question and validates them against the key.
+    Results are cached process-wide since the same option strings repeat across every subject and delivery of a survey.
+    See `parse_answer_options.cache_info()` for hit/miss counts.
+
+    Args:
+        survey_id (str): Survey ID. Used to find replacement options in `SURVEY_ANSWER_OPTIONS`.
+        question_id (str): Question ID. Used to find replacement options in `SURVEY_ANSWER_OPTIONS`.
+        opts (str): String of answer options split by semicolons
+        n_ans_options (int, optional): Expected number of answer options according to the key. Defaults to None (not validated).
+
+    Returns:
+        tuple: Answer options. A tuple of tuples if replacement options for several survey versions are used.
+            None if the number of answer options does not match the key.
+        bool: True if the answer options were replaced with those in `SURVEY_ANSWER_OPTIONS`
+    """
+    ans_opts, sc_space_sep = split_answer_options(opts)
+    options_replaced = False
+
+    # Options aren't separated as expected (e.g., "opt 1;opt 2;...")
+    # If there is a replacement for this exact survey, use it
+    if sc_space_sep and survey_id in SURVEY_ANSWER_OPTIONS.keys():
+        ans_opts = SURVEY_ANSWER_OPTIONS[survey_id][question_id]
+        options_replaced = True
+
+    # Number of answer options extracted from survey is incorrect according to the key.
+    # Either parsed incorrectly or original survey was improperly constructed (may be the case for surveys collected prior to 2025)
+    if (
+        not options_replaced
+        and n_ans_options is not None
+        and len(ans_opts) != n_ans_options
+    ):
+        if survey_id in SURVEY_ANSWER_OPTIONS.keys():
+            ans_opts = SURVEY_ANSWER_OPTIONS[survey_id][question_id]
+            options_replaced = True
+        else:
+            return None, options_replaced
+
+    return (
+        tuple(tuple(x) if isinstance(x, list) else x for x in ans_opts),
+        options_replaced,
+    )
 
-import statistics
-from functools import reduce
+
+class ScoringPlan(object):
+    """Immutable scoring rules for a single survey, compiled from one column of the survey key.
+
+    Answer -> score tables are built once per question (and set of answer options)
+    so that scoring an answer is a single dictionary lookup.
+    `fingerprint` is a stable hash of the survey's key column, used to detect key edits.
+    """
+
+    __slots__ = (
+        "id",
+        "fingerprint",
+        "index",
+        "multiplier",
+        "invert",
+        "invert_qs",
+        "unique_score",
+        "_tables",
+    )
+
+    def __init__(self, key):
+        """Compiles a scoring plan
+
+        Args:
+            key (Series): Column of the loaded survey key (see `BeiweSurvey.load_key`) for this survey.
+        """
+        set_attr = super().__setattr__
+        set_attr("id", key.name)
+        set_attr("fingerprint", fingerprint(key.to_dict()))
+        set_attr("index", key["index"])
+        set_attr(
+            "multiplier",
+            key["multiplier"] if "multiplier" in key and key["multiplier"] else 1,
+        )
+        set_attr("invert", bool(key["invert"]))
+        set_attr("invert_qs", ScoringPlan._to_set(key["invert_qs"]))
+        set_attr(
+            "unique_score",
+            dict(key["unique_score"]) if isinstance(key["unique_score"], dict) else {},
+        )
+        # Memo of answer -> score dicts, not part of the plan itself
+        set_attr("_tables", {})
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ScoringPlan is immutable")
+
+    def __getstate__(self):
+        """Slots of the plan, used by pickle and copy. The memo is rebuilt on demand."""
+        return {
+            name: getattr(self, name) for name in self.__slots__ if name != "_tables"
+        }
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            object.__setattr__(self, name, value)
+        object.__setattr__(self, "_tables", {})
+
+    def __repr__(self):
+        return f"ScoringPlan(id={self.id!r})"
+
+    @staticmethod
+    def _to_set(x):
+        """Key entries are lists if multiple values were given, otherwise a single number or None"""
+        if not x:
+            return frozenset()
+        return frozenset(x) if isinstance(x, list) else frozenset([x])
+
+    def _score_position(self, n_opts, pos, q_num):
+        """Score of the answer at position `pos` (or numeric answer `pos`) of question `q_num`"""
+        # This question needs to be inverted (a match on index 0 = max possible score)
+        if self.invert or q_num + 1 in self.invert_qs:
+            return self.multiplier * ((n_opts - 1 - pos) + self.index)
+        # This question has unique scoring rules
+        elif q_num + 1 in self.unique_score:
+            return self.unique_score[q_num + 1][pos]
+        # Score according to index (a match on index 0 = min possible score)
+        else:
+            return self.multiplier * (self.index + pos)
+
+    def _score_uncached(self, ans_opts, answer, q_num, parse_err):
+        """Reference scoring of `answer`, used for answers that are not one of `ans_opts`"""
+        try:
+            pos = int(answer)
+        except ValueError:  # answer non-numeric (expected most of the time)
+            try:
+                pos = ans_opts.index(answer)
+            except ValueError:
+                return parse_err
+        return self._score_position(len(ans_opts), pos, q_num)
+
+    def table(self, ans_opts, q_num):
+        """Returns the answer -> score dict for question `q_num` with answer options `ans_opts`
+
+        Args:
+            ans_opts (tuple): Stripped answer options (strings)
+            q_num (int): Index of this question
+
+        Returns:
+            dict: Score of every answer option that can be scored
+        """
+        try:
+            return self._tables[(q_num, ans_opts)]
+        except KeyError:
+            pass
+
+        table = {}
+        for opt in ans_opts:
+            if opt in table:
+                continue
+            try:
+                table[opt] = self._score_uncached(ans_opts, opt, q_num, None)
+            except (IndexError, KeyError, TypeError):
+                continue  # Let the error surface if this answer is actually given
+        self._tables[(q_num, ans_opts)] = table
+        return table
+
+    def score(self, ans_opts, answer, q_num, parse_err):
+        """Scores a single answer
+
+        Args:
+            ans_opts (list): List of answer options (strings)
+            answer (string): The answer to score
+            q_num (int): Index of this question
+            parse_err (int): Value to return if `answer` cannot be scored
+
+        Returns:
+            int: Scored value
+        """
+        ans_opts = tuple(i.strip() for i in ans_opts)
+        answer = answer.strip() if isinstance(answer, str) else answer
+
+        score = self.table(ans_opts, q_num).get(answer)
+        if score is None:
+            score = self._score_uncached(ans_opts, answer, q_num, parse_err)
+        return score
 
 
 class BeiweSurvey(object):
@@ -22,6 +404,8 @@ class BeiweSurvey(object):
         skip_ans=-101,
         validation_err=-301,
         file_df="",
+        plan=None,
+        compact=False,
     ):
         """Builds Survey object
 
@@ -36,13 +420,16 @@ class BeiweSurvey(object):
             validation_err (int, optional): Value to assign to an answer if validation of question failed. Defaults to -301.
             file_df (str, optional): Path to the CSV survey file that is readable by pandas.
                 If file is in a zip file, `file_df` should be zipfile.ZipFile.open(). Defaults to "".
+            plan (Union[ScoringPlan, None], optional): Precompiled scoring plan for this survey
+                (see `BeiweSurvey.load_key`). Compiled from the key if None. Defaults to None.
+            compact (bool, optional): Load the file with `read_survey_csv` (less memory,
+                other columns are dropped). Defaults to False.
 
         Raises:
             Exception: Survey ID not found in key
             Exception: Survey ID and key ID do not match. Make sure correct key is being passed.
         """
         file_df = file_df if file_df else file
-        self.df = pd.read_csv(file_df, na_filter=False)
         self.parse_err = parse_err
         self.skip_ans = skip_ans
         self.validation_err = validation_err
@@ -52,6 +439,11 @@ class BeiweSurvey(object):
         # No need for checks here because errors will appear in key validation
         self.id = id if id else file.parent.name
 
+        if compact:
+            self.df = read_survey_csv(file_df, self.id)
+        else:
+            self.df = pd.read_csv(file_df, na_filter=False)
+
         # key supersedes key_path if both are passed
         if not key.empty or not key_path:
             # Robust to caller passing specific key for this study or whole loaded df
@@ -73,6 +465,14 @@ class BeiweSurvey(object):
             except KeyError:
                 raise Exception("Survey ID not found in key")
 
+        if plan is None:
+            plan = ScoringPlan(self.key)
+        elif plan.id != self.id:
+            raise Exception(
+                "Survey ID and scoring plan ID do not match. Make sure correct plan is being passed."
+            )
+        self.plan = plan
+
     def score(self, ans_opts, answer, q_num):
         """Survey scoring algorithm
 
@@ -84,50 +484,7 @@ class BeiweSurvey(object):
         Returns:
             int: Scored value
         """
-        # Cleaning just in case
-        ans_opts = [i.strip() for i in ans_opts]
-        answer = answer.strip() if isinstance(answer, str) else answer
-
-        # Check for multiplier
-        mult = (
-            self.key["multiplier"]
-            if "multiplier" in self.key and self.key["multiplier"]
-            else 1
-        )
-
-        # Score
-        try:
-            # This question needs to be inverted (a match on index 0 = max possible score)
-            if self.key["invert"] or (
-                self.key["invert_qs"] and q_num + 1 in self.key["invert_qs"]
-            ):
-                return mult * ((len(ans_opts) - 1 - int(answer)) + self.key["index"])
-            # This question has unique scoring rules
-            elif (
-                self.key["unique_score"]
-                and q_num + 1 in self.key["unique_score"].keys()
-            ):
-                return self.key["unique_score"][q_num + 1][int(answer)]
-            # Score according to index (a match on index 0 = min possible score)
-            else:
-                return mult * (self.key["index"] + int(answer))
-        except ValueError:  # answer non-numeric (expected most of the time)
-            try:
-                if self.key["invert"] or (
-                    self.key["invert_qs"] and q_num + 1 in self.key["invert_qs"]
-                ):
-                    return mult * (
-                        (len(ans_opts) - 1 - ans_opts.index(answer)) + self.key["index"]
-                    )
-                elif (
-                    self.key["unique_score"]
-                    and q_num + 1 in self.key["unique_score"].keys()
-                ):
-                    return self.key["unique_score"][q_num + 1][ans_opts.index(answer)]
-                else:
-                    return mult * (self.key["index"] + ans_opts.index(answer))
-            except ValueError:
-                return self.parse_err
+        return self.plan.score(ans_opts, answer, q_num, self.parse_err)
 
     def eval_question(self, opts, ans, q_num, score_flag, question_id):
         """Splits answer options and returns answer score
@@ -141,124 +498,138 @@ class BeiweSurvey(object):
         Returns:
             int: Scored answer
         """
-
-        # Beiwe separates questions with semicolon
-        sc_space_sep = False
-        options_replaced = False
-
         # Catch skippable rows before extracting answer options
         if not score_flag:
-            return None, options_replaced
+            return None, False
         elif ans == "NO_ANSWER_SELECTED":
-            return self.skip_ans, options_replaced
-
-        # Containers
-        ans_opts = []
-        prev_split = []  # Will be an re.Match object
-
-        # Check if expected splits exist (e.g., "opt 1;opt 2;...")
-        if re.findall(r"\S;\S", opts):
-            splits = re.finditer(r"\S;\S", opts)  # Use them if they exist
-        elif self.id in SURVEY_ANSWER_OPTIONS.keys():
-            # If there is a replacement for this exact survey, use it
-            ans_opts = SURVEY_ANSWER_OPTIONS[self.id][question_id]
-            options_replaced = True
-        else:
-            # Assume splits are separated with spaces, too (e.g., "opt 1; opt 2; ...")
-            splits = re.finditer(r"\S;\s\S", opts)
-            sc_space_sep = True
-
-        # Extract each answer option
-        # Cannot simply use "split(";") because options may contain semicolons"
-        if not options_replaced:
-            while True:
-                try:
-                    this_split = splits.__next__()
-                    if not prev_split:  # First option
-                        ans_opts.append(opts[0 : this_split.start() + 1])
-                    else:
-                        if (
-                            not sc_space_sep
-                            and this_split.start() - prev_split.end() == 1
-                        ) or (
-                            sc_space_sep and this_split.start() - prev_split.end() == 2
-                        ):  # Single character option
-                            # Take just that character
-                            ans_opts.extend(
-                                [opts[prev_split.end() - 1], opts[this_split.start()]]
-                            )
-                        else:
-                            # End of previous split and start of current one
-                            ans_opts.append(
-                                opts[prev_split.end() - 1 : this_split.start() + 1]
-                            )
-                    prev_split = this_split  # Update
-                # Length of iterable isn't know prior to looping. Catch for last ans option.
-                except StopIteration:
-                    # If match starts with split pattern, single character ans opt exists
-                    # Extract both single character option and whatever is remaining
-                    last_block = opts[this_split.end() - 1 : len(opts)]
-                    if re.match(r"\S;\S", last_block):
-                        ans_opts.extend(
-                            [
-                                opts[this_split.end() - 1],
-                                opts[this_split.end() + 1 : len(opts)],
-                            ]
-                        )
-                    elif re.match(r"\S;\s\S", last_block):
-                        ans_opts.extend(
-                            [
-                                opts[this_split.end() - 1],
-                                opts[this_split.end() + 2 : len(opts)],
-                            ]
-                        )
-                    else:
-                        # Final answer option is remainder of "q"
-                        ans_opts.append(last_block)
-                    break
-
-        # Number of answer options extracted from survey is incorrect according to the key.
-        # Either parsed incorrectly or original survey was improperly constructed (may be the case for surveys collected prior to 2025)
-        if (
-            not options_replaced
-            and "n_ans_options"
-            in self.key  # Prevents errors since n_ans_options is not technically mandatory
-            and self.key["n_ans_options"]
-            and len(ans_opts) != self.key["n_ans_options"][q_num]
-        ):
-            if self.id in SURVEY_ANSWER_OPTIONS.keys():
-                ans_opts = SURVEY_ANSWER_OPTIONS[self.id][question_id]
-                options_replaced = True
-            else:
-                return self.validation_err, options_replaced
+            return self.skip_ans, False
+
+        ans_opts, options_replaced = self.answer_options(opts, q_num, question_id)
+        if ans_opts is None:
+            return self.validation_err, options_replaced
+        return self.score_options(ans_opts, ans, q_num), options_replaced
+
+    def answer_options(self, opts, q_num, question_id):
+        """Extracts the answer options of a question and validates them against the key
+
+        Args:
+            opts (str): String of answer options split by semicolons
+            q_num (int): This question's number
+            question_id (str): This question's ID
+
+        Returns:
+            tuple: Answer options (see `parse_answer_options`). None if the number of answer options does not match the key.
+            bool: True if the answer options were replaced with those in `SURVEY_ANSWER_OPTIONS`
+        """
+        n_ans_options = (
+            self.key["n_ans_options"]  # Not technically mandatory
+            if "n_ans_options" in self.key and self.key["n_ans_options"]
+            else None
+        )
+        return parse_answer_options(
+            self.id,
+            question_id,
+            opts,
+            n_ans_options[q_num] if n_ans_options is not None else None,
+        )
 
+    def score_options(self, ans_opts, ans, q_num):
+        """Scores an answer given the answer options extracted by `answer_options`
+
+        Args:
+            ans_opts (list): Answer options, or list of lists of answer options
+            ans (str): Answer for this question
+            q_num (int): This question's number
+
+        Returns:
+            int: Scored answer
+        """
         # If ans_opts is a list of lists, which is possible if using replacement options
         # since different survey years have same question ids with different answer option formats,
         # Go through all sets of options and return if it scores it sucessfully
-        if any(isinstance(el, list) for el in ans_opts):
+        if any(isinstance(el, (list, tuple)) for el in ans_opts):
             for curr_ans_opts in ans_opts:
                 score = self.score(curr_ans_opts, ans, q_num)
                 if score != self.parse_err:
-                    return score, options_replaced
+                    return score
         else:  # ans_options is a single list of options
-            return self.score(ans_opts, ans, q_num), options_replaced
+            return self.score(ans_opts, ans, q_num)
 
         # If list of lists loop didn't return, return whatever it's got
-        # Will always be self.parse_err, True
-        return score, options_replaced
+        # Will always be self.parse_err
+        return score
+
+    def score_columns(self, df, q_nums=None):
+        """Scores every row of a survey dataframe at once.
+        Equivalent to calling `eval_question` on every row, but each distinct
+        question/answer combination is only parsed and scored once.
+
+        Args:
+            df (DataFrame): Survey data that has been through `preprocess` and `mark_to_score`.
+                May contain several stacked instances of this survey.
+            q_nums (array-like, optional): Question number of each row. Defaults to None (row position).
+
+        Returns:
+            ndarray: Score of each row
+            ndarray: Whether answer options were replaced for each row
+        """
+        n_rows = len(df)
+        q_nums = np.arange(n_rows) if q_nums is None else np.asarray(q_nums)
+        scores = np.full(n_rows, None, dtype=object)
+        options_replaced = np.full(n_rows, False, dtype=object)
+
+        # Rows that are not scored keep None, skipped rows get the sentinel
+        score_flag = df["score_flag"].to_numpy(dtype=bool)
+        skipped = score_flag & (df["answer"] == "NO_ANSWER_SELECTED").to_numpy()
+        scores[skipped] = self.skip_ans
+        to_score = score_flag & ~skipped
+        if not to_score.any():
+            return scores, options_replaced
+
+        rows = pd.DataFrame(
+            {
+                "q_num": q_nums[to_score],
+                "opts": df["question answer options"].to_numpy()[to_score],
+                "question_id": df["question id"].to_numpy()[to_score],
+                "answer": df["answer"].to_numpy()[to_score],
+            }
+        )
+        # Groups are numbered in order of first appearance, same as drop_duplicates
+        codes = (
+            rows.groupby(list(rows.columns), sort=False, dropna=False)
+            .ngroup()
+            .to_numpy()
+        )
+
+        unique_scores = []
+        unique_replaced = []
+        for q_num, opts, question_id, ans in rows.drop_duplicates().itertuples(
+            index=False
+        ):
+            q_num = int(q_num)
+            ans_opts, replaced = self.answer_options(opts, q_num, question_id)
+            unique_scores.append(
+                self.validation_err
+                if ans_opts is None
+                else self.score_options(ans_opts, ans, q_num)
+            )
+            unique_replaced.append(replaced)
+
+        scores[to_score] = np.array(unique_scores, dtype=object)[codes]
+        options_replaced[to_score] = np.array(unique_replaced, dtype=object)[codes]
+        return scores, options_replaced
 
     def preprocess(self):
         """Cleans the survey dataframe by removing brackets
         and replacing " ;" and " ; " with ";" in question answer options.
         """
-        self.df["question answer options"] = [
-            x.replace("[", "").replace("]", "").replace(" ;", ";").replace(" ; ", ";")
-            for x in self.df["question answer options"]
-        ]
-        self.df["answer"] = [
-            x.replace("[", "").replace("]", "") if isinstance(x, str) else x
-            for x in self.df["answer"]
-        ]
+        self.df["question answer options"] = replace_in_strings(
+            self.df["question answer options"],
+            [("[", ""), ("]", ""), (" ;", ";"), (" ; ", ";")],
+        )
+        self.df["answer"] = replace_in_strings(
+            self.df["answer"], [("[", ""), ("]", "")]
+        )
 
     def mark_to_score(self):
         """Adds a "score_flag" column to self.df
@@ -266,36 +637,39 @@ class BeiweSurvey(object):
         Marks as false: "not presented, only answer if + no answer selected, yes/no question rows,
         info_text_box, free_response, and slider rows.
         """
-        score_flag = [True] * len(self.df)
-        idx = self.df.loc[
+        # yes/no questions. Checked once per distinct string of answer options.
+        codes, opts = pd.factorize(self.df["question answer options"])
+        is_yes_no = (
+            pd.Series(opts, dtype=object)
+            .str.lower()
+            .str.contains("(?=.*yes)(?=.*no)", na=False)
+            .to_numpy()
+        )
+        # Code -1 (missing options) maps to the appended False
+        is_yes_no = np.append(is_yes_no, False)[codes]
+
+        skip = (
             (self.df["answer"] == "NOT_PRESENTED")
             | (
                 (self.df["answer"] == "NO_ANSWER_SELECTED")
                 & (
                     self.df["question text"]
                     .str.lower()
-                    .str.startswith("(only answer if")
+                    .str.startswith("(only answer if", na=False)
                 )
             )
-            | (
-                self.df["question answer options"]
-                .str.lower()
-                .str.contains("(?=.*yes)(?=.*no)")  # yes/no questions
-            )
+            | is_yes_no
             | (
                 self.df["question type"].isin(
                     ["info_text_box", "free_response", "slider"]
                 )
             )
-        ].index
-
-        # Include additionally specified questions to skip
-        addl_skip = (
-            [x - 1 for x in self.key["no_score"]] if self.key["no_score"] else []
         )
+        score_flag = ~skip.to_numpy(dtype=bool)
 
-        for index in set(list(idx.array) + addl_skip):
-            score_flag[index] = False
+        # Include additionally specified questions to skip
+        if self.key["no_score"]:
+            score_flag[[x - 1 for x in self.key["no_score"]]] = False
 
         self.df["score_flag"] = score_flag
 
@@ -310,54 +684,166 @@ class BeiweSurvey(object):
         self.mark_to_score()
 
         # Score each answer
-        self.df[["score", "options_replaced"]] = [
-            self.eval_question(opts, ans, q_num, score_flag, question_id)
-            for q_num, (opts, ans, score_flag, question_id) in enumerate(
-                zip(
-                    self.df["question answer options"],
-                    self.df["answer"],
-                    self.df["score_flag"],
-                    self.df["question id"],
-                )
-            )
-        ]
+        self._set_scores(*self.score_columns(self.df))
         self.clean_to_save()
 
-    def export(self, out_dir, out_prefix=""):
+    def _set_scores(self, scores, options_replaced):
+        """Adds "score" and "options_replaced" columns to `self.df`.
+        Values are inferred per column (e.g., None -> nan next to numbers), as when building a DataFrame from rows.
+        """
+        for name, values in (("score", scores), ("options_replaced", options_replaced)):
+            self.df[name] = pd.Series(values).infer_objects().to_numpy(dtype=object)
+
+    @staticmethod
+    def parse_and_score_many(surveys):
+        """Parses and scores several instances of the same survey in one pass.
+        Scoring uses the key and error values of the first survey.
+
+        Args:
+            surveys (list): `BeiweSurvey` objects that share the same survey ID
+
+        Raises:
+            Exception: Surveys do not share the same survey ID
+        """
+        if not surveys:
+            return
+        if any(survey.id != surveys[0].id for survey in surveys):
+            raise Exception("All surveys must share the same survey ID")
+
+        for survey in surveys:
+            survey.preprocess()
+            survey.mark_to_score()
+
+        cols = ["question answer options", "answer", "score_flag", "question id"]
+        lengths = [len(survey.df) for survey in surveys]
+        scores, options_replaced = surveys[0].score_columns(
+            pd.concat([survey.df[cols] for survey in surveys], ignore_index=True),
+            q_nums=np.concatenate([np.arange(n) for n in lengths]),
+        )
+
+        # Split results back into their own surveys
+        bounds = np.cumsum([0] + lengths)
+        for survey, start, end in zip(surveys, bounds[:-1], bounds[1:]):
+            survey._set_scores(scores[start:end], options_replaced[start:end])
+            survey.clean_to_save()
+
+    def status(self):
+        """Returns the status of the scores in `self.df`
+
+        Returns:
+            str: "SKIPPED_ANS", "PARSE_ERR" or "VALIDATION_ERR" if any score has that value
+                (checked in this order), otherwise "OK"
+        """
+        if "score" in self.df.columns:
+            scores = self.df["score"].unique()
+            if self.skip_ans in scores:
+                return "SKIPPED_ANS"
+            elif self.parse_err in scores:
+                return "PARSE_ERR"
+            elif self.validation_err in scores:
+                return "VALIDATION_ERR"
+        return "OK"
+
+    def export(self, out_dir, out_prefix="", output_format="csv"):
         """Saves `self.df` to specified location.
-            Appends "_OUT" always. Appends "_OUT_SKIPPED_ANS" and "_OUT_PARSE_ERR"
-            if self.skipped_ans or self.parse_err are in self.df.score.
+            Appends "_OUT" always. For CSVs, also appends the status ("_OUT_SKIPPED_ANS",
+            "_OUT_PARSE_ERR" or "_OUT_VALIDATION_ERR") if it isn't "OK" (see `status`).
+            Parquet files store it in a "status" column instead.
 
         Args:
             out_dir (str): Path to directory into which `self.df` should be saved.
             out_prefix (str, optional): Prefix to prepend to filename. Defaults to "".
+            output_format (str, optional): One of `OUTPUT_FORMATS`. Defaults to "csv".
+
+        Returns:
+            Path: Path of the saved file
         """
-        out_suffix = "_OUT"
+        name, data = self.export_data(out_prefix, output_format)
+        out_path = Path(out_dir).joinpath(name)
+        out_path.write_bytes(data)
+        return out_path
 
+    def export_data(self, out_prefix="", output_format="csv"):
+        """Serializes `self.df` as `export` saves it, without saving it
+
+        Args:
+            out_prefix (str, optional): Prefix to prepend to filename. Defaults to "".
+            output_format (str, optional): One of `OUTPUT_FORMATS`. Defaults to "csv".
+
+        Returns:
+            str: Name of the file
+            bytes: Contents of the file
+        """
+        status = self.status()
         if not out_prefix:
             out_prefix = self.subject_id
-        if "score" in self.df.columns:
-            if self.skip_ans in self.df["score"].unique():
-                out_suffix = "_OUT_SKIPPED_ANS"
-            elif self.parse_err in self.df["score"].unique():
-                out_suffix = "_OUT_PARSE_ERR"
-            elif self.validation_err in self.df["score"].unique():
-                out_suffix = "_OUT_VALIDATION_ERR"
-
-        self.df.to_csv(
-            Path(out_dir).joinpath(
-                out_prefix + "_" + self.file.stem + out_suffix + ".csv"
-            ),
-            index=False,
-            header=True,
+        out_stem = out_prefix + "_" + self.file.stem + "_OUT"
+
+        if output_format == "parquet":
+            return out_stem + ".parquet", to_bytes(
+                self.df.assign(status=status), output_format
+            )
+        if status != "OK":
+            out_stem += "_" + status
+        return out_stem + ".csv", to_bytes(self.df, output_format)
+
+    @staticmethod
+    def read_export(fpath, data=None):
+        """Reads a file saved by `export`
+
+        Args:
+            fpath (Path): Path to the file
+            data (bytes, optional): Contents of the file if already read. Defaults to None.
+
+        Returns:
+            DataFrame: Saved data
+            str: Status of the scores (see `status`)
+        """
+        df = read_output(fpath, data)
+        if fpath.suffix == ".parquet":
+            status = df.pop("status")
+            return df, status.iloc[0] if len(status) else "OK"
+        return df, next((x for x in SCORE_STATUSES if fpath.stem.endswith(x)), "OK")
+
+    def dataset_rows(self):
+        """Returns `self.df` as rows of a survey dataset (see `soccon.output.upsert_partition`)
+
+        Returns:
+            DataFrame: `self.df` with `DATASET_COLUMNS` prepended
+        """
+        stem = self.file.stem
+        sp_ind = stem.find(" ")
+        meta = pd.DataFrame(
+            {
+                "subject_id": self.subject_id,
+                "date": stem[:sp_ind],
+                "time": stem[sp_ind + 1 : stem.find("+")],
+                "instance": stem,
+                "status": self.status(),
+            },
+            index=self.df.index,
+            columns=DATASET_COLUMNS,
         )
+        return pd.concat([meta, self.df], axis=1)
 
     @staticmethod
-    def load_key(fpath):
-        """Loads and processes survey key
+    def compile_key(key):
+        """Compiles a scoring plan for every survey in the key
 
         Args:
-            fpath (str): Path to survey key CSV or XLSX.
+            key (DataFrame): Key loaded by `BeiweSurvey.load_key`
+
+        Returns:
+            dict: Keys = survey ids, values = `ScoringPlan`
+        """
+        return {survey_id: ScoringPlan(key[survey_id]) for survey_id in key.columns}
+
+    @staticmethod
+    def parse_key(key):
+        """Processes the "beiwe" sheet of the survey key
+
+        Args:
+            key (DataFrame): "beiwe" sheet as read from the key workbook
 
         Returns:
             DataFrame: Key formatted such that columns are survey ids
@@ -369,8 +855,6 @@ class BeiweSurvey(object):
                 for x in df[name]
             ]
 
-        key = pd.read_excel(fpath, sheet_name="beiwe")
-
         # Convert string of invert, no_score vals to list
         key["invert_qs"] = to_list(key, "invert_qs")
         key["no_score"] = to_list(key, "no_score")
@@ -409,11 +893,35 @@ class BeiweSurvey(object):
         ]
 
         key = key.T
-        return (
+        key = (
             key.rename(columns=key.loc["id"])
             .drop(key.index[0])
             .replace({float("nan"): None})
         )
+        return key
+
+    @staticmethod
+    def load_key(fpath, compile_plans=False):
+        """Loads and processes survey key (see `load_key_workbook`)
+
+        Args:
+            fpath (str): Path to survey key XLSX.
+            compile_plans (bool, optional): Also compile a `ScoringPlan` for every survey. Defaults to False.
+
+        Returns:
+            DataFrame: Key formatted such that columns are survey ids
+            dict: Only if `compile_plans`. Keys = survey ids, values = `ScoringPlan`
+
+        Raises:
+            ValueError: Key has no "beiwe" sheet
+        """
+        workbook = load_key_workbook(fpath)
+        key = workbook["beiwe"]
+        if key is None:
+            raise ValueError("Worksheet named 'beiwe' not found")
+        if compile_plans:
+            return key, workbook["beiwe_plans"]
+        return key
 
 
 class RedcapSurvey(object):
@@ -424,6 +932,7 @@ class RedcapSurvey(object):
         key=None,
         id="",
         file_df="",
+        choices=None,
     ):
         """Builds Survey object
 
@@ -434,6 +943,8 @@ class RedcapSurvey(object):
             id (str, optional): Survey ID. Defaults to "".
             file_df (str, optional): Path to the CSV survey file that is readable by pandas.
                 If file is in a zip file, `file_df` should be zipfile.ZipFile.open(). Defaults to "".
+            choices (Union[dict, None], optional): Precomputed answer translations of the key's questions
+                (see `RedcapSurvey.load_key`). Built from the key if None. Defaults to None.
 
         Raises:
             Exception: Survey ID not found in key
@@ -442,6 +953,7 @@ class RedcapSurvey(object):
         file_df = file_df if file_df else file
         self.df = pd.read_csv(file_df, na_filter=False)
         self.file = Path(file)
+        self.choices = choices
 
         # No need for checks here because errors will appear in key validation
         self.id = id if id else file.stem
@@ -452,8 +964,8 @@ class RedcapSurvey(object):
         elif key_path:
             try:
                 # Loading the key will always give the full df so no need for extra conditionals
-                key_df = RedcapSurvey.load_key(key_path, "redcap")
-                self.key = key_df.loc[key.df["Form Name"] == self.id, :]
+                key_df = RedcapSurvey.load_key(key_path)
+                self.key = key_df.loc[key_df["Form Name"] == self.id, :]
             except ValueError:  # ID doesn't exist as a sheet
                 raise Exception("Survey ID not found in key")
         else:
@@ -462,16 +974,15 @@ class RedcapSurvey(object):
             )
 
     @staticmethod
-    def load_key(fpath):
-        """Loads and processes survey key
+    def parse_key(key):
+        """Processes the "redcap" sheet of the survey key
 
         Args:
-            fpath (str): Path to survey key CSV or XLSX.
+            key (DataFrame): "redcap" sheet as read from the key workbook
 
         Returns:
             DataFrame: Key parsed for use in survey processing
         """
-        key = pd.read_excel(fpath, sheet_name="redcap")
         key.rename(
             columns={
                 "Choices, Calculations, OR Slider Labels": "choices",
@@ -494,6 +1005,54 @@ class RedcapSurvey(object):
         ]
         return key
 
+    @staticmethod
+    def load_key(fpath, compile_choices=False):
+        """Loads and processes survey key (see `load_key_workbook`)
+
+        Args:
+            fpath (str): Path to survey key XLSX.
+            compile_choices (bool, optional): Also return the answer translations of every question
+                (see `question_choices`). Defaults to False.
+
+        Returns:
+            DataFrame: Key parsed for use in survey processing
+            dict: Only if `compile_choices`. See `question_choices`
+
+        Raises:
+            ValueError: Key has no "redcap" sheet
+        """
+        workbook = load_key_workbook(fpath)
+        key = workbook["redcap"]
+        if key is None:
+            raise ValueError("Worksheet named 'redcap' not found")
+        if compile_choices:
+            return key, workbook["redcap_choices"]
+        return key
+
+    @staticmethod
+    def question_choices(key):
+        """Returns how the answers to every question in `key` are translated
+
+        Args:
+            key (DataFrame): Key loaded by `load_key` (or a subset of its rows)
+
+        Returns:
+            dict: Keys = question, values = dict (keys = answer as exported, values = translated answer)
+                or None if the question's answers aren't translated. The first row of a question is used.
+                REDCap field names are unique within a project, so the map of the whole key
+                can be used for any of its forms.
+        """
+        choices = {}
+        for question, field_type, this_q_key in zip(
+            key["question"], key["Field Type"], key["choices"]
+        ):
+            if question in choices:
+                continue
+            if field_type == "yesno":
+                this_q_key = {"0": "no", "1": "yes"}
+            choices[question] = this_q_key if isinstance(this_q_key, dict) else None
+        return choices
+
     def process(self):
         # Drop rows where all data columns are empty
         data_cols = [
@@ -502,217 +1061,615 @@ class RedcapSurvey(object):
         self.df.dropna(how="all", subset=data_cols, inplace=True)
         self.df = self.df.reset_index()
 
-        D = {}  # Keys = column name (question shorthand), values = parsed column data
-        for this_label, this_col in self.df.items():  # Iterate through columns
-            # Get question label as it appears in the key
-            if "___" in this_label:  # Checkbox answer type
-                question = this_label[: this_label.find("___")]
-            else:
-                question = this_label
-
-            if question in self.key["question"].values:
-                this_q_ser = self.key.loc[self.key["question"] == question]
-
-                if this_q_ser["Field Type"].values[0] == "yesno":
-                    this_q_key = {"0": "no", "1": "yes"}
-                else:
-                    this_q_key = this_q_ser["choices"].values[0]
-
-                # Translate answers based on key
-                if isinstance(this_q_key, dict):
-                    # Conditionals in comprehension may be unnecessary, but they're good safety
-                    D[this_label] = [
-                        this_q_key[x] if this_q_key and x in this_q_key.keys() else x
-                        for x in this_col
-                    ]
-                # No "translation" to do, convert series to list and add as dict value
-                else:
-                    D[this_label] = list(this_col)
-            else:
-                D[this_label] = list(this_col)
+        # Get question labels as they appear in the key (checkbox columns are "<question>___<choice>")
+        questions = self.df.columns.str.replace(r"___.*$", "", regex=True)
+        choices = (
+            self.choices
+            if self.choices is not None
+            else RedcapSurvey.question_choices(self.key)
+        )
+
+        # Keys = column name (question shorthand), values = translated column data
+        translated = {}
+        for this_label, question in zip(self.df.columns, questions):
+            this_q_key = choices.get(question)
+            if not this_q_key:
+                continue
+            # Translate answers based on key. Others (including all values of
+            # numeric columns, whose values can't match the string keys) are kept as is.
+            this_col = self.df[this_label]
+            is_key = this_col.isin(this_q_key.keys())
+            if is_key.any():
+                translated[this_label] = this_col.where(
+                    ~is_key, this_col.map(this_q_key)
+                )
 
         # Replace df with processed data
-        self.df = pd.DataFrame(D)
+        self.df = self.df.assign(**translated)
 
-    def export(self, out_dir, out_prefix=""):
+    def export(self, out_dir, out_prefix="", output_format="csv"):
         """Saves `self.df` to specified location.
             Appends "_OUT" always.
 
         Args:
             out_dir (str): Path to directory into which `self.df` should be saved.
             out_prefix (str, optional): Prefix to prepend to filename. Defaults to "".
+            output_format (str, optional): One of `OUTPUT_FORMATS`. Defaults to "csv".
+
+        Returns:
+            Path: Path of the saved file
+        """
+        name, data = self.export_data(out_prefix, output_format)
+        out_path = Path(out_dir).joinpath(name)
+        out_path.write_bytes(data)
+        return out_path
+
+    def export_data(self, out_prefix="", output_format="csv"):
+        """Serializes `self.df` as `export` saves it, without saving it
+
+        Args:
+            out_prefix (str, optional): Prefix to prepend to filename. Defaults to "".
+            output_format (str, optional): One of `OUTPUT_FORMATS`. Defaults to "csv".
+
+        Returns:
+            str: Name of the file
+            bytes: Contents of the file
         """
         if out_prefix:
             out_prefix += "_"
+        name = out_prefix + self.file.stem + "_OUT." + output_format
+        return name, to_bytes(self.df, output_format)
+
 
-        self.df.to_csv(
-            Path(out_dir).joinpath(out_prefix + self.file.stem + "_OUT.csv"),
-            index=False,
-            header=True,
+def key_cache_dir():
+    """Returns the directory in which `load_key_workbook` caches keys for the current user"""
+    if os.name == "nt":
+        root = os.environ.get("LOCALAPPDATA") or Path.home().joinpath(
+            "AppData", "Local"
         )
+    else:
+        root = os.environ.get("XDG_CACHE_HOME") or Path.home().joinpath(".cache")
+    return Path(root, "soccon")
 
 
-def aggregate_beiwe(data_dir, key_path):
-    """Take all processed data and create a summary Excel doc saved to `out_dir`.
-    First tab is a data summary, second tab is a basic statistics summary,
-    remaining tabs contain detailed scoring for each individual survey
+def key_cache_path(fpath):
+    """Returns the path of the cache `load_key_workbook` keeps for the key at `fpath`.
+    Caches are named by a hash of the key's absolute path and kept in `key_cache_dir`,
+    not next to the key, as keys are usually on drives shared with other users.
+    """
+    digest = hashlib.sha256(str(Path(fpath).resolve()).encode()).hexdigest()
+    return key_cache_dir().joinpath("key_" + digest[:16] + ".cache")
+
+
+def load_key_workbook(fpath):
+    """Loads the survey key workbook, only parsing it with Excel if it changed.
+    The processed "beiwe" and "redcap" sheets, the scoring plans compiled from the "beiwe" sheet,
+    the answer translations of the "redcap" sheet and the sheet names are cached in the current user's cache directory (see `key_cache_path`).
+    The cache is used if the workbook's size and modification time, or its content hash, match the cached ones.
 
     Args:
-        data_dir (str): Path to directory in which `processed` data exists.
-        out_dir (str): Directory to which summary sheet should be saved.
-        key_path (str): Path to CSV key containing survey scoring rules
-        out_name (str, optional): Name of output file. Defaults to "SURVEY_SUMMARY".
+        fpath (str): Path to survey key XLSX.
+
+    Returns:
+        dict: Keys = "beiwe", "redcap" (processed sheets, None if the sheet doesn't exist),
+            "beiwe_plans" (see `BeiweSurvey.compile_key`, None without a "beiwe" sheet),
+            "redcap_choices" (see `RedcapSurvey.question_choices`, None without a "redcap" sheet), "sheet_names"
     """
-    data_dir = Path(data_dir)
-    survey_key = BeiweSurvey.load_key(key_path)
+    fpath = Path(fpath)
+    cache_path = key_cache_path(fpath)
+    stat = fpath.stat()
+    try:
+        with open(cache_path, "rb") as f:
+            cache = pickle.load(f)
+    except Exception:  # No cache or unreadable cache. Parse the workbook instead.
+        cache = {}
+
+    if cache.get("version") == KEY_CACHE_VERSION:
+        if (cache["size"], cache["mtime"]) == (stat.st_size, stat.st_mtime_ns):
+            return cache["key"]
+
+    data = fpath.read_bytes()
+    digest = hashlib.sha256(data).hexdigest()
+    if cache.get("version") == KEY_CACHE_VERSION and cache["hash"] == digest:
+        key = cache["key"]
+    else:
+        with pd.ExcelFile(io.BytesIO(data)) as excel:
+            sheet_names = excel.sheet_names
+            key = {
+                "beiwe": (
+                    BeiweSurvey.parse_key(excel.parse("beiwe"))
+                    if "beiwe" in sheet_names
+                    else None
+                ),
+                "redcap": (
+                    RedcapSurvey.parse_key(excel.parse("redcap"))
+                    if "redcap" in sheet_names
+                    else None
+                ),
+                "sheet_names": sheet_names,
+            }
+        key["beiwe_plans"] = (
+            None if key["beiwe"] is None else BeiweSurvey.compile_key(key["beiwe"])
+        )
+        key["redcap_choices"] = (
+            None
+            if key["redcap"] is None
+            else RedcapSurvey.question_choices(key["redcap"])
+        )
+
+    cache = {
+        "version": KEY_CACHE_VERSION,
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+        "hash": digest,
+        "key": key,
+    }
+    # The cache is only an optimization, so failing to write it is fine
+    tmp_path = cache_path.with_name(cache_path.name + ".tmp")
+    try:
+        # Only readable by the current user
+        cache_path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            pickle.dump(cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass
+    return key
+
+
+def saved_instances(files):
+    """Reads the survey instances saved in processed files
 
-    # Aggregate
-    aggs_dict = {}  # Dictionary of dataframes
-    stats = {}  # Dictionary (keys = subject ids) of dictionaries (keys = survey ids, values = list of survey score sums)
-    for spath in data_dir.glob("*"):
-        if not spath.is_dir() or spath.name not in survey_key.columns:
+    Args:
+        files (iterable): Tuples of path and contents of files saved by `BeiweSurvey.export`
+            or dataset partitions (see `soccon.output.upsert_partition`)
+
+    Yields:
+        tuple: Subject ID, date, time, status and DataFrame of each survey instance
+    """
+    for fpath, data in files:
+        if is_partition(fpath):
+            yield from partition_instances(read_partition(fpath, data))
             continue
 
-        # survey_id is spath.name
-        this_key = survey_key[spath.name]
-        survey_name = this_key["name"]
-
-        agg_list = []  # Reset aggregate dataframe every new survey
-        for fpath in spath.glob("*.csv"):
-            # Collect metadata
-            file = fpath.stem
-            us_ind = file.find("_")
-            sp_ind = file.find(" ")
-            subject_id = file[0:us_ind]
-            date = file[us_ind + 1 : sp_ind]
-            time = file[sp_ind + 1 : file.find("+")]
-
-            # Parse datetime
-            # dt = file[us_ind + 1 : file.find("+")]
-            # datetime.strptime(dt, "%Y-%m-%d %H_%M_%S")
-
-            # Load file
-            this_df = pd.read_csv(fpath)
-            
-            # Drop "info_text_box" rows without resetting index 
-            # so that subscores still work and output is clean
-            this_df.drop(
-                this_df.loc[this_df["question type"] == "info_text_box"].index,
-                axis=0,
-                inplace=True,
+        # Collect metadata
+        file = fpath.stem
+        us_ind = file.find("_")
+        sp_ind = file.find(" ")
+        subject_id = file[0:us_ind]
+        date = file[us_ind + 1 : sp_ind]
+        time = file[sp_ind + 1 : file.find("+")]
+
+        # Parse datetime
+        # dt = file[us_ind + 1 : file.find("+")]
+        # datetime.strptime(dt, "%Y-%m-%d %H_%M_%S")
+
+        # Load file
+        this_df, status = BeiweSurvey.read_export(fpath, data)
+        yield subject_id, date, time, status, this_df
+
+
+def score_stats(stats):
+    """Summary statistics of the survey sums of every subject
+
+    Args:
+        stats (GroupedStats): Sums of every survey instance, added with groups = "Subject ID",
+            "Survey ID" and "Survey Name" and times = dates (see `SCORE_STATS_COLUMNS`)
+
+    Returns:
+        DataFrame: One row per subject and survey ID, in order of appearance.
+            Slope is the least squares change of the sum per day (NaN if taken on fewer than two dates).
+    """
+    columns = ["Subject ID", "Survey Name"] + list(SCORE_STATS_NAMES.values())
+    if stats.empty:
+        return pd.DataFrame(columns=columns)
+    result = stats.result()
+    for col in ["first", "last"]:
+        result[col] = result[col].dt.strftime("%Y-%m-%d")
+    result = result.rename(columns=SCORE_STATS_NAMES).reset_index()
+
+    # Subjects in order of appearance, then surveys in order of appearance
+    subjects = pd.Index(pd.unique(result["Subject ID"]))
+    result = result.iloc[
+        np.argsort(subjects.get_indexer(result["Subject ID"]), kind="stable")
+    ]
+    return result[columns].reset_index(drop=True)
+
+
+def timepoint_summary(aggs_dict):
+    """Aligns the sums of every survey by subject and timepoint with a single index join.
+    The nth instance (by date and time) of a survey for a subject is at timepoint n,
+    so there is one row per subject and timepoint.
+
+    Args:
+        aggs_dict (dict): Keys = survey names, values = dataframes of scores for every instance of the survey
+
+    Returns:
+        DataFrame: Columns = "Subject ID", "timepoint", then "date_<name>", "time_<name>" and <name> (sum) per survey
+    """
+    summary = []
+    for name, df in aggs_dict.items():
+        df = df.sort_values(["Subject ID", "date", "time"], kind="stable")
+        timepoint = df.groupby("Subject ID").cumcount().rename("timepoint") + 1
+        df = df.set_index([df["Subject ID"], timepoint])[["date", "time", "sum"]]
+        summary.append(
+            df.rename(
+                columns={"date": "date_" + name, "time": "time_" + name, "sum": name}
             )
-            
-            is_nonnumeric = "score" not in this_df.columns
-
-            # Establish sum
-            if fpath.stem.endswith("PARSE_ERR"):
-                sum_field = "PARSING ERROR"
-            elif fpath.stem.endswith("SKIPPED_ANS"):
-                sum_field = "SKIPPED ANSWER"
-            elif fpath.stem.endswith("VALIDATION_ERR"):
-                sum_field = "VALIDATION ERROR"
-            elif is_nonnumeric:
-                sum_field = "NON-NUMERIC SURVEY"
-            else:
-                this_df.score = pd.to_numeric(this_df.score, errors="coerce")
-                sum_field = float(this_df.score.sum())
-
-            # Add this survey's data to aggregate "dataframe" (list, really)
-            # Get subscores if ALSFRS
-            if is_nonnumeric:
-                agg_list.append(
-                    [subject_id, date, time] + this_df.answer.to_list() + [sum_field]
-                )
-            # elif "ALSFRS" in survey_name:
-            elif "subscores" in this_key.index and this_key["subscores"]:
-                res = (
-                    [subject_id, date, time]
-                    + this_df.score.to_list()
-                    + [
-                        float(this_df.score[inds].sum())
-                        for inds in this_key.subscores.values()
-                    ]
-                    + [sum_field]
-                )
-                # Replace erroring subscores with nan
-                agg_list.append(
-                    [
-                        float("nan") if not isinstance(x, str) and x < 0 else x
-                        for x in res
-                    ]
-                )
-            else:
-                agg_list.append(
-                    [subject_id, date, time] + this_df.score.to_list() + [sum_field]
-                )
+        )
+    if not summary:
+        return pd.DataFrame(columns=["Subject ID", "timepoint"])
+    return pd.concat(summary, axis=1, join="outer").sort_index().reset_index()
+
+
+def load_stats_cache(out):
+    """Loads the survey sums saved by `beiwe_sheets` with the processed surveys
+
+    Args:
+        out (OutputDir or OutputArchive): Processed surveys (see `soccon.output.open_output`)
+
+    Returns:
+        dict: Keys = output names, values = dict (keys = "fingerprint" (see `manifest.output_fingerprints`),
+            "rows" (sums with `SCORE_STATS_COLUMNS`)). Empty if there is no (readable) cache.
+    """
+    try:
+        cache = json.loads(out.read(STATS_CACHE_NAME))
+    except (OSError, KeyError, ValueError):
+        return {}
+    if cache.get("version") != STATS_CACHE_VERSION:
+        return {}
+    return cache["outputs"]
+
 
-            # Do not add to final statistics if there is missing/bad data
-            if not isinstance(sum_field, str):
-                if subject_id in stats.keys():
-                    if spath.name in stats[subject_id].keys():
-                        stats[subject_id][spath.name].append(this_df.score.sum())
-                    else:
-                        stats[subject_id][spath.name] = [this_df.score.sum()]
-                else:
-                    stats[subject_id] = {spath.name: [this_df.score.sum()]}
-
-        # Create column headers
-        if "subscores" in this_key.index and this_key["subscores"]:
-            cols = (
-                ["Subject ID", "date", "time"]
-                + this_df["question text"].to_list()
-                + list(this_key.subscores.keys())
-                + ["sum"]
+def save_stats_cache(out, outputs):
+    """Saves the survey sums of every output with the processed surveys
+
+    Args:
+        out (OutputDir or OutputArchive): Processed surveys (see `soccon.output.open_output`)
+        outputs (dict): See `load_stats_cache`
+    """
+    out.write(
+        STATS_CACHE_NAME,
+        json.dumps(
+            {"version": STATS_CACHE_VERSION, "outputs": dict(sorted(outputs.items()))}
+        ).encode(),
+    )
+
+
+def beiwe_outputs(out, survey_key):
+    """Lists the processed Beiwe surveys by survey ID.
+    Sorted so that results don't depend on the file system or output format.
+    Dataset partitions (one per subject) hold every instance of the survey for that subject
+    and are listed in the order `read_dataset` reads them (parquet first).
+
+    Args:
+        out (OutputDir or OutputArchive): Processed surveys (see `soccon.output.open_output`)
+        survey_key (DataFrame): Key loaded by `BeiweSurvey.load_key`
+
+    Returns:
+        dict: Keys = survey directories, values = (list of instance files, list of dataset partition names)
+    """
+    survey_files = {}
+    for fpath in map(PurePosixPath, out.names()):
+        spath = PurePosixPath(fpath.parts[0])
+        if (
+            spath.name in survey_key.columns
+            and fpath.suffix in (".csv", ".parquet")
+            and (
+                len(fpath.parts) == 2 or (len(fpath.parts) == 3 and is_partition(fpath))
             )
+        ):
+            survey_files.setdefault(spath, []).append(fpath)
+    return {
+        spath: (
+            sorted(x for x in fpaths if not is_partition(x)),
+            sorted(
+                (x.as_posix() for x in fpaths if is_partition(x)),
+                key=lambda x: not x.endswith(".parquet"),
+            ),
+        )
+        for spath, fpaths in sorted(survey_files.items())
+    }
+
+
+def survey_instances(out, fpaths, partitions, contents):
+    """Reads the survey instances of one survey ID
+
+    Args:
+        out (OutputDir or OutputArchive): Processed surveys (see `soccon.output.open_output`)
+        fpaths (list): Instance files (see `beiwe_outputs`)
+        partitions (list): Names of dataset partitions (see `beiwe_outputs`)
+        contents (Iterator): Tuples of path and contents of files, from which those of `fpaths` are taken
+
+    Yields:
+        tuple: Name of the output holding the instance and the instance (see `saved_instances`)
+    """
+    for fpath, instance in zip(fpaths, saved_instances(islice(contents, len(fpaths)))):
+        yield fpath.as_posix(), instance
+    if partitions:
+        by_subject = {PurePosixPath(name).stem: name for name in partitions}
+        for instance in partition_instances(read_dataset(out, partitions)):
+            yield by_subject.get(instance[0]), instance
+
+
+def score_survey(this_key, survey_id, instances):
+    """Scores the instances of one survey ID for the summary
+
+    Args:
+        this_key (Series): Key of the survey (see `BeiweSurvey.load_key`)
+        survey_id (str): Survey ID
+        instances (list): Instances from `saved_instances`
+
+    Returns:
+        DataFrame: One row per instance (subject ID, date, time, scores, subscores and sum).
+            None if there are no instances.
+        DataFrame: Sums of the instances that could be scored (see `SCORE_STATS_COLUMNS`),
+            indexed by the position of their instance
+    """
+    survey_name = this_key["name"]
+    has_subscores = "subscores" in this_key.index and bool(this_key["subscores"])
+    if not instances:
+        return None, pd.DataFrame(columns=SCORE_STATS_COLUMNS)
+
+    # [subject_id, date, time, status, answers (non-numeric) or scores]
+    rows = []
+    for subject_id, date, time, status, this_df in instances:
+        # Drop "info_text_box" rows without resetting index 
+        # so that subscores still work and output is clean
+        this_df.drop(
+            this_df.loc[this_df["question type"] == "info_text_box"].index,
+            axis=0,
+            inplace=True,
+        )
+        if "score" not in this_df.columns:
+            values = this_df.answer.to_list()
         else:
-            cols = (
-                ["Subject ID", "date", "time"]
-                + this_df["question text"].to_list()
-                + ["sum"]
+            values = pd.to_numeric(this_df.score, errors="coerce")
+        rows.append([subject_id, date, time, status, values])
+    instances = rows
+
+    # Stack the scores of instances with the same questions into a matrix
+    # (instances x questions) and get every subscore and the sum in one product
+    # with a 0/1 mask (questions x (subscores + sum))
+    groups = {}
+    for i, instance in enumerate(instances):
+        if isinstance(instance[4], pd.Series):
+            groups.setdefault(tuple(instance[4].index), []).append(i)
+    for index, inds in groups.items():
+        scores = np.array([instances[i][4].to_numpy(dtype=float) for i in inds])
+        scores = scores.reshape(len(inds), len(index))
+        subscore_inds = this_key.subscores.values() if has_subscores else []
+        mask = np.column_stack(
+            [np.isin(index, x) for x in subscore_inds]
+            + [np.ones(len(index), dtype=bool)]
+        )
+        totals = np.nan_to_num(scores, nan=0.0) @ mask
+        sums = totals[:, -1].copy()
+        if has_subscores:
+            # Replace erroring scores and subscores with nan
+            scores[scores < 0] = np.nan
+            totals[totals < 0] = np.nan
+        for i, row, row_totals, row_sum in zip(inds, scores, totals, sums):
+            instances[i][4] = (
+                row.tolist(),
+                row_totals[:-1].tolist(),
+                row_sum,
+                row_totals[-1],
             )
 
-        # Key = readable survey name, value = dataframe of scores for every instance of this survey
-        if survey_name in aggs_dict.keys():
-            # Surveys may have different IDs but the same "common" name.
-            aggs_dict[survey_name] = pd.concat(
-                [aggs_dict[survey_name], pd.DataFrame(agg_list, columns=cols)]
-            )
+    # Add this survey's data to aggregate "dataframe" (list, really)
+    agg_list = []
+    score_rows = []  # Tidy table (one row per instance) of this survey's sums
+    score_inds = []
+    for i, (subject_id, date, time, status, values) in enumerate(instances):
+        is_nonnumeric = not isinstance(values, tuple)
+
+        # Establish sum
+        if status == "PARSE_ERR":
+            sum_field = "PARSING ERROR"
+        elif status == "SKIPPED_ANS":
+            sum_field = "SKIPPED ANSWER"
+        elif status == "VALIDATION_ERR":
+            sum_field = "VALIDATION ERROR"
+        elif is_nonnumeric:
+            sum_field = "NON-NUMERIC SURVEY"
         else:
-            aggs_dict[survey_name] = pd.DataFrame(agg_list, columns=cols)
-
-    # Extract statistics from lists of sums (that are buried in stats dict)
-    subj_ids = []
-    surv_names = []
-    n = []
-    avgs = []
-    stds = []
-    for s_id, survey_dicts in stats.items():
-        for survey_id, survey_sum in survey_dicts.items():
-            subj_ids.append(s_id)
-            surv_names.append(survey_key[survey_id]["name"])
-            n.append(len(survey_sum))
-            avgs.append(statistics.fmean(survey_sum))
-            if len(survey_sum) > 1:
-                stds.append(
-                    statistics.stdev([float(x) for x in survey_sum])
-                )  # statistics.stdev errors on list of numpy floats
-            else:
-                stds.append(float("nan"))
-
-    # Build DF
-    stats_df = pd.DataFrame(
-        {
-            "Subject ID": subj_ids,
-            "Survey Name": surv_names,
-            "n": n,
-            "Mean": avgs,
-            "STD": stds,
-        }
+            sum_field = float(values[2])
+
+        if is_nonnumeric:
+            agg_list.append([subject_id, date, time] + values + [sum_field])
+        else:
+            scores, subscores, _, masked_sum = values
+            agg_list.append(
+                [subject_id, date, time]
+                + scores
+                + subscores
+                + [sum_field if isinstance(sum_field, str) else float(masked_sum)]
+            )
+
+        # Do not add to final statistics if there is missing/bad data
+        if not isinstance(sum_field, str):
+            score_rows.append([subject_id, survey_id, survey_name, date, sum_field])
+            score_inds.append(i)
+
+    # Create column headers
+    if has_subscores:
+        cols = (
+            ["Subject ID", "date", "time"]
+            + this_df["question text"].to_list()
+            + list(this_key.subscores.keys())
+            + ["sum"]
+        )
+    else:
+        cols = (
+            ["Subject ID", "date", "time"]
+            + this_df["question text"].to_list()
+            + ["sum"]
+        )
+    return (
+        pd.DataFrame(agg_list, columns=cols),
+        pd.DataFrame(score_rows, columns=SCORE_STATS_COLUMNS, index=score_inds),
     )
 
+
+def beiwe_survey_names(data_dir, key_path):
+    """Returns the names of the Beiwe surveys processed in `data_dir`, i.e. the survey tabs
+    `beiwe_sheets` yields, without reading any survey
+
+    Args:
+        data_dir (str): Path to directory (or archive, see `open_output`) in which `processed` data exists.
+        key_path (str): Path to Excel key containing survey scoring rules
+
+    Returns:
+        set: Survey names
+    """
+    survey_key = BeiweSurvey.load_key(key_path)
+    out = open_output(Path(data_dir))
+    try:
+        return {
+            survey_key[spath.name]["name"] for spath in beiwe_outputs(out, survey_key)
+        }
+    finally:
+        out.close()
+
+
+def beiwe_sheets(
+    data_dir,
+    key_path,
+    prefetch_depth=PREFETCH_DEPTH,
+    prefetch_mb=PREFETCH_MB,
+    legacy_summary=False,
+    stats_only=False,
+):
+    """Yields the tabs of the Beiwe summary one survey at a time (collected by `aggregate_beiwe`).
+    Survey IDs with the same name share a tab, so they are read one after the other
+    and only the tab being yielded is held in memory (with the sums of every survey for the summary).
+    The sums of every output are saved with the processed surveys (see `STATS_CACHE_NAME`)
+    along with a fingerprint of the inputs that produced the output (see `manifest.output_fingerprints`),
+    so the statistics can be updated by only reading outputs that are new or changed since (`stats_only`).
+    Outputs saved without a manifest are always read.
+
+    Args:
+        data_dir (str): Path to directory (or archive, see `open_output`) in which `processed` data exists.
+        key_path (str): Path to Excel key containing survey scoring rules
+        prefetch_depth (int, optional): Number of files read ahead (see `prefetch`). Defaults to PREFETCH_DEPTH.
+        prefetch_mb (float, optional): Maximum megabytes of files read ahead. Defaults to PREFETCH_MB.
+        legacy_summary (bool, optional): Whether to build the summary by merging surveys on subject ID only
+            (every instance paired with every other) instead of aligning them by timepoint
+            (see `timepoint_summary`). Defaults to False.
+        stats_only (bool, optional): Only compute the statistics, reusing the saved sums of unchanged outputs.
+            Defaults to False.
+
+    Yields:
+        tuple: Tab name and DataFrame. Every survey name (in order of survey ID), then "Beiwe Summary"
+            and "Beiwe Stats". Only "Beiwe Stats" if `stats_only`.
+    """
+    data_dir = Path(data_dir)
+    survey_key = BeiweSurvey.load_key(key_path)
+
+    # Files are listed first so that reading can run ahead across surveys.
+    # A survey's partitions are read together as one dataset after the other files of the survey.
+    out = open_output(data_dir)
+    try:
+        survey_files = beiwe_outputs(out, survey_key)
+
+        # Surveys may have different IDs but the same "common" name.
+        survey_names = {}  # Keys = survey names, values = survey directories
+        for spath in survey_files:
+            survey_names.setdefault(survey_key[spath.name]["name"], []).append(spath)
+
+        # Outputs whose saved sums are still current don't need to be read for the statistics
+        fingerprints = manifest.output_fingerprints(manifest.load_manifest(out))
+        cache = load_stats_cache(out)
+        cached = {
+            name
+            for name, entry in cache.items()
+            if fingerprints.get(name) is not None
+            and entry["fingerprint"] == fingerprints[name]
+        }
+        to_read = {}
+        for spath in chain.from_iterable(survey_names.values()):
+            fpaths, partitions = survey_files[spath]
+            to_read[spath] = (
+                [x for x in fpaths if not (stats_only and x.as_posix() in cached)],
+                [x for x in partitions if not (stats_only and x in cached)],
+            )
+        contents = prefetch(
+            chain.from_iterable(fpaths for fpaths, _ in to_read.values()),
+            lambda x: out.read(x.as_posix()),
+            prefetch_depth,
+            prefetch_mb,
+        )
+
+        # Aggregate
+        # Keys = survey names, values = subject IDs, dates, times and sums for the summary
+        summary_frames = {}
+        survey_rows = {}  # Keys = survey directories, values = sums of every output
+        new_cache = {}
+        for survey_name, spaths in survey_names.items():
+            agg_frames = []
+            for spath in spaths:
+                # survey_id is spath.name
+                this_key = survey_key[spath.name]
+                fpaths, partitions = to_read[spath]
+                outputs, instances = [], []
+                for output, instance in survey_instances(
+                    out, fpaths, partitions, contents
+                ):
+                    outputs.append(output)
+                    instances.append(instance)
+                agg_df, score_rows = score_survey(this_key, spath.name, instances)
+                if agg_df is not None and not stats_only:
+                    agg_frames.append(agg_df)
+
+                # Sums of every output of the survey, just read or saved
+                rows = {x: [] for x in [x.as_posix() for x in fpaths] + partitions}
+                for i, row in zip(score_rows.index, score_rows.values.tolist()):
+                    rows.setdefault(outputs[i], []).append(row)
+                survey_rows[spath] = []
+                all_fpaths, all_partitions = survey_files[spath]
+                for name in [x.as_posix() for x in all_fpaths] + all_partitions:
+                    this_rows = rows[name] if name in rows else cache[name]["rows"]
+                    survey_rows[spath].extend(this_rows)
+                    if fingerprints.get(name) is not None:
+                        new_cache[name] = {
+                            "fingerprint": fingerprints[name],
+                            "rows": this_rows,
+                        }
+
+            if agg_frames:
+                agg_df = pd.concat(agg_frames)
+                summary_frames[survey_name] = agg_df[SUMMARY_COLUMNS]
+                yield survey_name, agg_df
+
+        if new_cache != cache:
+            # The saved sums are only an optimization, so failing to save them is fine
+            try:
+                save_stats_cache(out, new_cache)
+            except OSError:
+                pass
+    finally:
+        out.close()
+
+    # Statistics of the survey sums, updated with the sums of one survey ID at a time (in order of survey ID)
+    stats = GroupedStats()
+    for spath in survey_files:
+        rows = pd.DataFrame(survey_rows[spath], columns=SCORE_STATS_COLUMNS)
+        stats.add(rows.iloc[:, :3], rows["sum"], rows["date"])
+    stats_df = score_stats(stats)
+    if stats_only:
+        yield "Beiwe Stats", stats_df
+        return
+
     # Create summary sheet with all survey data
+    if not legacy_summary:
+        yield "Beiwe Summary", timepoint_summary(summary_frames)
+        yield "Beiwe Stats", stats_df
+        return
+
+    # Every instance of a survey is paired with every instance of the others (per subject)
     summary = []
-    for name, df in aggs_dict.items():
+    for name, df in summary_frames.items():
         new_date = "date_" + name
         new_time = "time_" + name
         sum_df = df.rename(columns={"sum": name, "date": new_date, "time": new_time})
@@ -721,27 +1678,101 @@ def aggregate_beiwe(data_dir, key_path):
         lambda left, right: pd.merge(left, right, on=["Subject ID"], how="outer"),
         summary,
     )
+    yield "Beiwe Summary", df_merged
+    yield "Beiwe Stats", stats_df
+
+
+def aggregate_beiwe(
+    data_dir,
+    key_path,
+    prefetch_depth=PREFETCH_DEPTH,
+    prefetch_mb=PREFETCH_MB,
+    legacy_summary=False,
+    stats_only=False,
+):
+    """Take all processed data and create a summary Excel doc saved to `out_dir`.
+    First tab is a data summary, second tab is a basic statistics summary,
+    remaining tabs contain detailed scoring for each individual survey.
+    Collects the tabs yielded by `beiwe_sheets`.
 
-    return df_merged, stats_df, aggs_dict
+    Args:
+        data_dir (str): Path to directory (or archive, see `open_output`) in which `processed` data exists.
+        key_path (str): Path to Excel key containing survey scoring rules
+        prefetch_depth (int, optional): Number of files read ahead (see `prefetch`). Defaults to PREFETCH_DEPTH.
+        prefetch_mb (float, optional): Maximum megabytes of files read ahead. Defaults to PREFETCH_MB.
+        legacy_summary (bool, optional): See `beiwe_sheets`. Defaults to False.
+        stats_only (bool, optional): Only compute the statistics, reusing the saved sums of unchanged outputs.
+            The summary is None and no survey tabs are returned. Defaults to False.
+
+    Returns:
+        DataFrame: Summary (see `timepoint_summary`)
+        DataFrame: Statistics (see `score_stats`)
+        dict: Keys = readable survey names, values = dataframe of scores for every instance of this survey
+    """
+    sheets = list(
+        beiwe_sheets(
+            data_dir, key_path, prefetch_depth, prefetch_mb, legacy_summary, stats_only
+        )
+    )
+    if stats_only:
+        return None, sheets[-1][1], {}
+    return sheets[-2][1], sheets[-1][1], dict(sheets[:-2])
 
 
-def aggregate_redcap(data_dir, key_path):
-    data_dir = Path(data_dir)
-    key_sheets = pd.ExcelFile(key_path).sheet_names
-    aggs_dict = {}
-    for spath in data_dir.glob("**"):
-        if not spath.is_dir() or spath.name not in key_sheets:
-            continue
+def redcap_sheets(
+    data_dir, key_path, prefetch_depth=PREFETCH_DEPTH, prefetch_mb=PREFETCH_MB, skip=()
+):
+    """Yields the tabs of the REDCap forms one form at a time (collected by `aggregate_redcap`),
+    so only the tab being yielded is held in memory
+
+    Args:
+        data_dir (str): Path to directory (or archive, see `open_output`) in which `processed` data exists.
+        key_path (str): Path to Excel key containing survey scoring rules
+        prefetch_depth (int, optional): Number of files read ahead (see `prefetch`). Defaults to PREFETCH_DEPTH.
+        prefetch_mb (float, optional): Maximum megabytes of files read ahead. Defaults to PREFETCH_MB.
+        skip (Iterable, optional): Names of forms that aren't read. Defaults to ().
+
+    Yields:
+        tuple: Form name and DataFrame of every export of the form
+    """
+    key_sheets = load_key_workbook(key_path)["sheet_names"]
+    skip = set(skip)
+
+    # Files are listed first so that reading can run ahead across surveys.
+    # Sorted so that results don't depend on the file system or output format,
+    # and so that the files of a form are read one after the other.
+    out = open_output(data_dir)
+    try:
+        survey_files = [
+            (fpath.parent.name, fpath)
+            for fpath in sorted(
+                map(PurePosixPath, out.names()),
+                key=lambda x: (x.parent.name, x.parent, x.name),
+            )
+            if fpath.parent.name in key_sheets
+            and fpath.parent.name not in skip
+            and fpath.suffix in (".csv", ".parquet")
+        ]
+        files = prefetch(
+            survey_files,
+            lambda x: out.read(x[1].as_posix()),
+            prefetch_depth,
+            prefetch_mb,
+        )
+        for survey_name, form_files in groupby(files, key=lambda x: x[0][0]):
+            yield survey_name, pd.concat(
+                [read_output(fpath, data) for (_, fpath), data in form_files]
+            )
+    finally:
+        out.close()
 
-        survey_name = spath.name
-        for fpath in spath.glob("*.csv"):
-            # Key = readable survey name, value = dataframe of scores for every instance of this survey
-            if survey_name in aggs_dict.keys():
-                # Surveys may have different IDs but the same "common" name.
-                aggs_dict[survey_name] = pd.concat(
-                    [aggs_dict[survey_name], pd.read_csv(fpath)]
-                )
-            else:
-                aggs_dict[survey_name] = pd.read_csv(fpath)
 
-    return aggs_dict
+def aggregate_redcap(
+    data_dir, key_path, prefetch_depth=PREFETCH_DEPTH, prefetch_mb=PREFETCH_MB
+):
+    """Collects the tabs yielded by `redcap_sheets`
+
+    Returns:
+        dict: Keys = readable survey names, values = dataframe of every export of this survey
+    """
+    return dict(redcap_sheets(data_dir, key_path, prefetch_depth, prefetch_mb))
@@ -1,3 +1,24 @@
+import copy
+import json
+import zlib
+import struct
+import hashlib
+import numbers
+import zipfile
+import threading
+import collections
+import numpy as np
+import pandas as pd
+
+# Fixed part of a zip file's local file header: signature, versions, flags, compression,
+# times, CRC, sizes and the lengths of the file name and extra field
+ZIP_LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+
+# Defaults for `prefetch`
+PREFETCH_DEPTH = 16
+PREFETCH_MB = 64
+
+
 def row_to_dict(
     row,
     row_sep_str,
@@ -52,3 +73,277 @@ def excel_style(row, col):
         col, rem = divmod(col - 1, len(letters))
         result[:0] = letters[rem]
     return "".join(result) + str(row)
+
+
+def fingerprint(obj):
+    """Returns a stable hash of `obj`, made of (nested) dicts, lists, strings, numbers and None.
+    Integral floats hash like ints, so a column's dtype changing from int to float
+    (e.g. because a value in another row was removed) does not change the hash.
+
+    Args:
+        obj (Any): Object to hash
+
+    Returns:
+        str: Hash of the form "sha256:<hex digest>"
+    """
+
+    def canonical(x):
+        if isinstance(x, dict):
+            return sorted(
+                ([canonical(k), canonical(v)] for k, v in x.items()), key=repr
+            )
+        if isinstance(x, (list, tuple)):
+            return [canonical(y) for y in x]
+        if isinstance(x, numbers.Real):
+            x = float(x)
+            return int(x) if x.is_integer() else x
+        return x
+
+    encoded = json.dumps(canonical(obj), default=str).encode()
+    return "sha256:" + hashlib.sha256(encoded).hexdigest()
+
+
+class GroupedStats(object):
+    """Per-group count, mean, sample standard deviation, median, min, max,
+    first and last time and least squares slope over time of values added in batches
+    (e.g. all instances of one survey). Batches are appended to a tidy table (one row per value,
+    so memory is proportional to the number of values, not to the frames they came from)
+    and the statistics are computed with one grouped aggregation over it.
+    """
+
+    def __init__(self):
+        self.batches = []
+
+    @property
+    def empty(self):
+        return not self.batches
+
+    def add(self, groups, values, times):
+        """Adds a batch of values
+
+        Args:
+            groups (DataFrame): Group of each value (one column per level)
+            values (Series): Values. NaNs are counted in "n" only.
+            times (Series): Time of each value (datetime). NaT values are left out of time statistics.
+        """
+        if groups.empty:
+            return
+        self.batches.append(
+            groups.assign(
+                _value=np.asarray(values, dtype=float),
+                _time=pd.to_datetime(np.asarray(times), errors="coerce"),
+            )
+        )
+
+    def result(self):
+        """Returns the statistics of every group
+
+        Returns:
+            DataFrame: One row per group (indexed by the group columns), in order of first appearance.
+                Columns = "n", "mean", "std", "median", "min", "max", "first", "last", "slope"
+                (change of the value per day, NaN if fewer than two distinct times)
+        """
+        columns = ["n", "mean", "std", "median", "min", "max", "first", "last", "slope"]
+        if self.empty:
+            return pd.DataFrame(columns=columns)
+        frame = pd.concat(self.batches, ignore_index=True)
+        keys = list(frame.columns[:-2])
+        values = frame["_value"]
+        with_time = frame["_time"].notna() & values.notna()
+        # Days since the epoch, centered on the group mean so that sums of squares stay small
+        day = ((frame["_time"] - pd.Timestamp(0)) / pd.Timedelta(days=1)).where(
+            with_time
+        )
+        day = day - day.groupby([frame[key] for key in keys], sort=False).transform(
+            "mean"
+        )
+        frame = frame.assign(_dd=day * day, _dv=day * values.where(with_time))
+
+        grouped = frame.groupby(keys, sort=False)
+        stats = grouped.agg(
+            n=("_value", "size"),
+            mean=("_value", "mean"),
+            std=("_value", "std"),
+            median=("_value", "median"),
+            min=("_value", "min"),
+            max=("_value", "max"),
+            first=("_time", "min"),
+            last=("_time", "max"),
+            m2_time=("_dd", "sum"),
+            c2_time=("_dv", "sum"),
+        )
+        stats["slope"] = (stats["c2_time"] / stats["m2_time"]).where(
+            stats["m2_time"] > 0
+        )
+        return stats[columns]
+
+
+def prefetch(items, read, depth=PREFETCH_DEPTH, max_mb=PREFETCH_MB):
+    """Reads upcoming `items` on a background thread while the caller works on earlier ones.
+    At most `depth` items and `max_mb` megabytes are held in memory
+    (an item larger than `max_mb` is still read once nothing else is held).
+    Errors raised while reading are raised to the caller at the item that caused them.
+
+    Args:
+        items (Iterable): Items to read, e.g. paths
+        read (Callable): Called with each item. Returns its contents as bytes.
+        depth (int, optional): Maximum number of items read ahead.
+            Items are read when they are needed (no thread) if less than 1. Defaults to PREFETCH_DEPTH.
+        max_mb (float, optional): Maximum number of megabytes read ahead. Defaults to PREFETCH_MB.
+
+    Yields:
+        tuple: (item, contents), in the order of `items`
+    """
+    if depth < 1:
+        for item in items:
+            yield item, read(item)
+        return
+
+    max_bytes = max_mb * 1024**2
+    buffered = collections.deque()  # (item, contents, size, error)
+    n_bytes = 0
+    closed = False
+    cond = threading.Condition()
+
+    def fill():
+        nonlocal n_bytes
+        try:
+            for item in items:
+                with cond:
+                    cond.wait_for(lambda: closed or len(buffered) < depth)
+                    if closed:
+                        return
+                try:
+                    contents, error = read(item), None
+                except Exception as e:
+                    contents, error = None, e
+                size = 0 if contents is None else len(contents)
+                with cond:
+                    cond.wait_for(
+                        lambda: closed or not buffered or n_bytes + size <= max_bytes
+                    )
+                    if closed:
+                        return
+                    buffered.append((item, contents, size, error))
+                    n_bytes += size
+                    cond.notify_all()
+        except Exception as e:  # Error while iterating over `items`
+            error = e
+        else:
+            error = None
+        with cond:
+            buffered.append((None, None, 0, StopIteration if error is None else error))
+            cond.notify_all()
+
+    thread = threading.Thread(target=fill, daemon=True)
+    thread.start()
+    try:
+        while True:
+            with cond:
+                cond.wait_for(lambda: buffered)
+                item, contents, size, error = buffered.popleft()
+                n_bytes -= size
+                cond.notify_all()
+            if error is StopIteration:
+                return
+            if error is not None:
+                raise error
+            yield item, contents
+    finally:
+        # Stops the thread if the caller stops early
+        with cond:
+            closed = True
+            cond.notify_all()
+
+
+def read_zip_member(zip_path, info):
+    """Reads a file within a zip file directly from its offset in the zip file.
+    Unlike `zipfile.ZipFile`, this does not parse the zip file's central directory,
+    so reading one member of a zip file with many members is cheap and can be done
+    by many processes at once. Get `info` from `ZipFile.infolist` once.
+    The file handle is closed before returning.
+
+    Args:
+        zip_path (Path): Path to the zip file
+        info (zipfile.ZipInfo): Info of the file within the zip file
+
+    Raises:
+        zipfile.BadZipFile: The local file header or the CRC of the contents is wrong
+
+    Returns:
+        bytes: Contents of the file
+    """
+    # Encrypted or compressed with something other than deflate. Leave it to zipfile.
+    if info.flag_bits & 0x1 or info.compress_type not in (
+        zipfile.ZIP_STORED,
+        zipfile.ZIP_DEFLATED,
+    ):
+        with zipfile.ZipFile(zip_path) as zf:
+            return zf.read(info)
+
+    with open(zip_path, "rb") as f:
+        f.seek(info.header_offset)
+        header = ZIP_LOCAL_HEADER.unpack(f.read(ZIP_LOCAL_HEADER.size))
+        if header[0] != b"PK\x03\x04":
+            raise zipfile.BadZipFile(f"Bad local file header for {info.filename}")
+        f.seek(header[-2] + header[-1], 1)  # File name and extra field
+        data = f.read(info.compress_size)
+
+    if info.compress_type == zipfile.ZIP_DEFLATED:
+        data = zlib.decompress(data, -zlib.MAX_WBITS)
+    if zlib.crc32(data) != info.CRC:
+        raise zipfile.BadZipFile(f"Bad CRC-32 for {info.filename}")
+    return data
+
+
+def copy_zip_member(src, info, writer):
+    """Copies a file within a zip file into another zip file without decompressing it.
+    The local file header and compressed contents are copied byte for byte and the file
+    is added to the central directory of `writer`. Relies on attributes of
+    `zipfile.ZipFile` (`_lock`, `fp`, `start_dir`, `filelist`, `NameToInfo`) that are not documented,
+    so callers should fall back to `ZipFile.writestr` if this raises `AttributeError`
+    (see `soccon.output.OutputArchive.close`).
+
+    Args:
+        src (BinaryIO): Zip file to copy from, opened for reading
+        info (zipfile.ZipInfo): Info of the file within `src` from `ZipFile.infolist`
+        writer (zipfile.ZipFile): Zip file to copy to, opened for writing
+
+    Raises:
+        zipfile.BadZipFile: The local file header is wrong
+        AttributeError: `writer` doesn't have the attributes this relies on
+    """
+    src.seek(info.header_offset)
+    header = src.read(ZIP_LOCAL_HEADER.size)
+    if len(header) < ZIP_LOCAL_HEADER.size:
+        raise zipfile.BadZipFile(f"Truncated local file header for {info.filename}")
+    fields = ZIP_LOCAL_HEADER.unpack(header)
+    if fields[0] != b"PK\x03\x04":
+        raise zipfile.BadZipFile(f"Bad local file header for {info.filename}")
+    name_len, extra_len = fields[-2:]
+    data = src.read(name_len + extra_len + info.compress_size)
+    # Data descriptor (optional signature, CRC and sizes) after the contents.
+    # Sizes take 8 bytes each if the local header has a zip64 extra field (ID 1), even for small files.
+    if info.flag_bits & 0x08:
+        extra = data[name_len : name_len + extra_len]
+        zip64 = False
+        pos = 0
+        while pos + 4 <= len(extra) and not zip64:
+            field_id, field_len = struct.unpack_from("<HH", extra, pos)
+            zip64 = field_id == 1
+            pos += 4 + field_len
+        n_bytes = 20 if zip64 else 12
+        descriptor = src.read(4)
+        if descriptor == b"PK\x07\x08":
+            n_bytes += 4
+        data += descriptor + src.read(n_bytes - 4)
+
+    info = copy.copy(info)
+    with writer._lock:
+        filelist, name_to_info = writer.filelist, writer.NameToInfo
+        writer.fp.seek(writer.start_dir)
+        info.header_offset = writer.start_dir
+        writer.fp.write(header + data)
+        writer.start_dir = writer.fp.tell()
+        filelist.append(info)
+        name_to_info[info.filename] = info